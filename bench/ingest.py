@@ -0,0 +1,427 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+import globals
+from broadcasting.ble_source import BleSource
+from broadcasting.broadcaster import Broadcaster
+from broadcasting.sensor_readers import SensorReader, SyntheticReader
+from cloud.firebase_app import ensure_firebase
+from metrics import MetricsRegistry
+from sensor_registry import SensorRegistry
+from settings_store import SettingsStore
+
+DEFAULT_TAGS = (1, 10, 100, 1000)
+
+# Settings of every scenario. time_interval 0 lets the deadbands decide, so the
+# upload path is exercised too.
+BENCH_SETTINGS = {
+    'time_interval': 0,
+    'upload_batch_window': 0.5,
+}
+
+#-------------------------------------------------------------------------------------------------#
+#                                          TimedReading                                           #
+#-------------------------------------------------------------------------------------------------#
+class TimedReading(tuple):
+    """
+    (mac_address, sensor_data) reading that remembers when it was generated. The BLE
+    source passes the tuple itself to the subscribers, so the time survives the trip.
+    """
+    generated = 0.0
+
+#-------------------------------------------------------------------------------------------------#
+#                                           TimedReader                                           #
+#-------------------------------------------------------------------------------------------------#
+class TimedReader(SensorReader):
+    """
+    Wraps a reader and stamps every reading with the time it was generated.
+    """
+
+    def __init__(self, reader: SensorReader) -> None:
+        self.reader = reader
+        self.generated = 0
+
+    def run(self, callback, run_flag) -> None:
+        def timed_callback(found_data):
+            reading = TimedReading(found_data)
+            reading.generated = time.perf_counter()
+            self.generated += 1
+            callback(reading)
+
+        self.reader.run(timed_callback, run_flag)
+
+#-------------------------------------------------------------------------------------------------#
+#                                            Scenario                                             #
+#-------------------------------------------------------------------------------------------------#
+class Scenario:
+    """
+    One benchmark run: `tags` synthetic sensors advertising `rate` times per second go
+    through the BLE source and the broadcaster to the fake Firebase at url.
+
+    The run starts in an empty directory, logs in, follows every tag and broadcasts
+    for warmup + duration seconds. Only the last `duration` seconds are measured.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, tags: int, rate: float, duration: float, warmup: float, url: str,
+                 settings: dict | None = None, metrics: bool = False) -> None:
+        self.tags = tags
+        self.rate = rate
+        self.duration = duration
+        self.warmup = warmup
+        self.url = url
+        self.settings = settings or {}
+        self.metrics = metrics
+
+        self.reader = None
+        self.broadcaster = None
+        self.processed = 0
+        self.callback_times = []
+        self.lags = []
+
+    #---------------------------------------------------------------------------------------------#
+    # run - Runs the scenario and returns the results                                             #
+    #---------------------------------------------------------------------------------------------#
+    def run(self) -> dict:
+        with tempfile.TemporaryDirectory(prefix="isolinna-bench-") as directory:
+            cwd = os.getcwd()
+            os.chdir(directory)
+            try:
+                self._setup()
+                return globals.aio_loop.run_until_complete(self._broadcast())
+            finally:
+                globals.settings_store.flush()
+                os.chdir(cwd)
+
+    #---------------------------------------------------------------------------------------------#
+    # _setup - Sets up the globals like isolinna.py does, against the fake Firebase              #
+    #---------------------------------------------------------------------------------------------#
+    def _setup(self) -> None:
+        synthetic = SyntheticReader(tags=self.tags, rate=self.rate)
+        self.reader = TimedReader(synthetic)
+
+        globals.metrics = MetricsRegistry(enabled=self.metrics)
+
+        globals.settings = {**BENCH_SETTINGS, **self.settings}
+        globals.settings['device_uuid'] = str(uuid.uuid4())
+        globals.settings['followed_sensors'] = list(synthetic.mac_addresses)
+        globals.settings_store = SettingsStore(globals.settings)
+
+        globals.firebase_config = {
+            "apiKey": "bench",
+            "authDomain": "localhost",
+            "databaseURL": self.url,
+            "storageBucket": "bench",
+            "authURL": self.url,
+        }
+        ensure_firebase()
+
+        user = globals.auth.sign_in_with_email_and_password("bench@localhost", "bench")
+        globals.settings['user_uid'] = user['localId']
+        globals.settings['id_token'] = user['idToken']
+        globals.settings['refresh_token'] = user['refreshToken']
+        globals.settings['token_expiration_time'] = int(time.time()) + int(user['expiresIn'])
+
+        globals.aio_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(globals.aio_loop)
+
+        globals.sensors = SensorRegistry(globals.settings['followed_sensors'])
+        globals.ble_source = BleSource(globals.aio_loop, globals.sensors, self.reader)
+
+    #---------------------------------------------------------------------------------------------#
+    # _broadcast - Broadcasts and measures                                                        #
+    #---------------------------------------------------------------------------------------------#
+    async def _broadcast(self) -> dict:
+        self.broadcaster = Broadcaster()
+        self._time_callback()
+        self.broadcaster.start()
+
+        await asyncio.sleep(self.warmup)
+        start = self._snapshot()
+        self.callback_times.clear()
+        self.lags.clear()
+
+        await asyncio.sleep(self.duration)
+        end = self._snapshot()
+        results = self._results(start, end)
+        results['scan_error'] = self.broadcaster.scan_error()
+        if self.metrics:
+            results['metrics'] = globals.metrics.snapshot()['metrics']
+
+        await self.broadcaster.stop()
+        return results
+
+    #---------------------------------------------------------------------------------------------#
+    # _time_callback - Measures every call of send_sensor_data                                    #
+    #---------------------------------------------------------------------------------------------#
+    def _time_callback(self) -> None:
+        send_sensor_data = self.broadcaster.send_sensor_data
+
+        def timed_send_sensor_data(found_data):
+            started = time.perf_counter()
+            send_sensor_data(found_data)
+            finished = time.perf_counter()
+
+            self.processed += 1
+            self.callback_times.append(finished - started)
+            self.lags.append(finished - found_data.generated)
+
+        self.broadcaster.send_sensor_data = timed_send_sensor_data
+
+    #---------------------------------------------------------------------------------------------#
+    # _snapshot - Returns the counters at this moment                                             #
+    #---------------------------------------------------------------------------------------------#
+    def _snapshot(self) -> dict:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        stats = self.broadcaster.stats()
+
+        return {
+            'time': time.perf_counter(),
+            'cpu': usage.ru_utime + usage.ru_stime,
+            'generated': self.reader.generated,
+            'processed': self.processed,
+            'uploaded': stats['uploaded'],
+            'requests': stats['requests'],
+            'dropped': self.broadcaster.subscription.dropped,
+            'errors': self.broadcaster.reading_errors,
+        }
+
+    #---------------------------------------------------------------------------------------------#
+    # _results - Computes the results from the counters at the start and the end                  #
+    #---------------------------------------------------------------------------------------------#
+    def _results(self, start: dict, end: dict) -> dict:
+        def delta(key):
+            return end[key] - start[key]
+
+        elapsed = delta('time')
+        processed = delta('processed')
+
+        return {
+            'tags': self.tags,
+            'rate': self.rate,
+            'duration': round(elapsed, 3),
+            'generated': delta('generated'),
+            'accepted': processed,
+            'dropped': delta('dropped'),
+            'errors': delta('errors'),
+            'readings_per_s': round(processed / elapsed, 1),
+            'callback_p50_us': _percentile(self.callback_times, 0.50, 1e6),
+            'callback_p99_us': _percentile(self.callback_times, 0.99, 1e6),
+            'lag_p50_ms': _percentile(self.lags, 0.50, 1e3),
+            'lag_p99_ms': _percentile(self.lags, 0.99, 1e3),
+            'uploaded': delta('uploaded'),
+            'uploads_per_s': round(delta('uploaded') / elapsed, 1),
+            'requests': delta('requests'),
+            'cpu_per_reading_us': round(delta('cpu') / processed * 1e6, 1) if processed else None,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'token_refreshes': self.broadcaster.token_manager.refreshes,
+            'settings_writes': globals.settings_store.writes,
+        }
+
+#-------------------------------------------------------------------------------------------------#
+# _percentile - Nearest-rank percentile of the samples, scaled to the reported unit               #
+#-------------------------------------------------------------------------------------------------#
+def _percentile(samples: list, fraction: float, scale: float):
+    if not samples:
+        return None
+
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * scale, 1)
+
+#-------------------------------------------------------------------------------------------------#
+# _free_port - Returns a free local TCP port                                                      #
+#-------------------------------------------------------------------------------------------------#
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+#-------------------------------------------------------------------------------------------------#
+# _start_fake_firebase - Starts the fake Firebase in its own process, so its CPU time and memory  #
+#                        are not counted                                                          #
+#-------------------------------------------------------------------------------------------------#
+def _start_fake_firebase(args) -> tuple:
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "tools.fake_firebase",
+            "--port", str(port),
+            "--latency", str(args.latency),
+            "--token-lifetime", str(args.token_lifetime),
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+
+    # Wait until it accepts connections
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                print("Could not start the fake Firebase.")
+                sys.exit(1)
+            time.sleep(0.05)
+
+    return process, f"http://127.0.0.1:{port}"
+
+#-------------------------------------------------------------------------------------------------#
+# _run_child - Runs one scenario in a new process, so every scenario has its own peak RSS         #
+#-------------------------------------------------------------------------------------------------#
+def _run_child(args, tags: int, url: str) -> dict:
+    command = [
+        sys.executable, "-m", "bench.ingest",
+        "--scenario", str(tags),
+        "--url", url,
+        "--rate", str(args.rate),
+        "--duration", str(args.duration),
+        "--warmup", str(args.warmup),
+    ]
+    if args.metrics:
+        command.append("--metrics")
+    for setting in args.setting:
+        command += ["--setting", setting]
+
+    result = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        print(f"Scenario with {tags} tags failed.")
+        sys.exit(1)
+
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+#-------------------------------------------------------------------------------------------------#
+# _commit - Current git commit, or None                                                           #
+#-------------------------------------------------------------------------------------------------#
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+#-------------------------------------------------------------------------------------------------#
+# _parse_setting - Parses a KEY=JSON command line argument                                        #
+#-------------------------------------------------------------------------------------------------#
+def _parse_setting(text: str) -> str:
+    key, separator, value = text.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError("expected KEY=VALUE")
+    try:
+        json.loads(value)
+    except json.JSONDecodeError:
+        raise argparse.ArgumentTypeError(f"{value} is not valid JSON")
+    return text
+
+#------------------------------------------------------------------------------------------------#
+#                                              MAIN                                              #
+#------------------------------------------------------------------------------------------------#
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the IsoLinna sensor ingest path")
+    parser.add_argument(
+        "--tags",
+        type=int,
+        nargs="+",
+        default=list(DEFAULT_TAGS),
+        help="numbers of synthetic tags to benchmark (default 1 10 100 1000)"
+    )
+    parser.add_argument("--rate", type=float, default=1, help="advertisements per tag per second, 0 = as fast as possible")
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds before the measurement starts")
+    parser.add_argument("--latency", type=float, default=0.02, help="latency of the fake Firebase in seconds")
+    parser.add_argument("--token-lifetime", type=int, default=10, help="ID token lifetime of the fake Firebase")
+    parser.add_argument(
+        "--setting",
+        type=_parse_setting,
+        action="append",
+        default=[],
+        metavar="KEY=JSON",
+        help="settings.json value for the scenarios, e.g. upload_batch_size=10. May be repeated."
+    )
+    parser.add_argument("--metrics", action="store_true", help="collect the metrics and add them to the results")
+    parser.add_argument("--output", metavar="FILE", help="write the results to a JSON file instead of stdout")
+    parser.add_argument("--scenario", type=int, metavar="TAGS", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    settings = {}
+    for setting in args.setting:
+        key, _, value = setting.partition("=")
+        settings[key] = json.loads(value)
+
+    # Is this a scenario process?
+    if args.scenario is not None:
+        # Yes...
+        scenario = Scenario(args.scenario, args.rate, args.duration, args.warmup, args.url, settings, args.metrics)
+        results = scenario.run()
+        print(json.dumps(results))
+
+        # Did the pipeline die or fail readings?
+        if results['scan_error'] is not None:
+            # Yes...
+            print(f"The scan task has ended: {results['scan_error']}", file=sys.stderr)
+            sys.exit(1)
+        if results['errors'] or (results['generated'] and not results['accepted']):
+            # Yes...
+            print(
+                f"{results['accepted']} of {results['generated']} readings accepted, {results['errors']} failed.",
+                file=sys.stderr
+            )
+            sys.exit(1)
+        return
+
+    # No...
+    process, url = _start_fake_firebase(args)
+    try:
+        results = []
+        for tags in args.tags:
+            print(f"Benchmarking {tags} tags...", file=sys.stderr)
+            results.append(_run_child(args, tags, url))
+    finally:
+        process.terminate()
+        process.wait()
+
+    report = {
+        'benchmark': "ingest",
+        'timestamp': datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'rate': args.rate,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'latency': args.latency,
+            'token_lifetime': args.token_lifetime,
+            'metrics': args.metrics,
+            'settings': {**BENCH_SETTINGS, **settings},
+        },
+        'results': results,
+    }
+
+    # Is the report written to a file?
+    if args.output:
+        # Yes...
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        # No...
+        print(json.dumps(report, indent=4))
+
+if __name__ == "__main__":
+    main()
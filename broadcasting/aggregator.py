@@ -0,0 +1,121 @@
+import math
+
+from constants import *
+
+# Values aggregated over the window. RSSI and battery are sent as the latest reading.
+AGGREGATE_FIELDS = ("temperature", "humidity", "pressure")
+
+# Keys that take() adds to a reading
+AGGREGATE_KEYS = ("samples",) + tuple(
+    f"{field}_{suffix}" for field in AGGREGATE_FIELDS for suffix in ("min", "max", "stddev")
+)
+
+#-------------------------------------------------------------------------------------------------#
+#                                          RunningStats                                           #
+#-------------------------------------------------------------------------------------------------#
+class RunningStats:
+    """
+    Count, mean, min, max and standard deviation of a stream of values in constant
+    memory (Welford's algorithm).
+    """
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self) -> None:
+        self.reset()
+
+    #---------------------------------------------------------------------------------------------#
+    # reset - Forgets every value                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def reset(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    #---------------------------------------------------------------------------------------------#
+    # add - Adds a value                                                                          #
+    #---------------------------------------------------------------------------------------------#
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    #---------------------------------------------------------------------------------------------#
+    # stddev - Population standard deviation of the values                                        #
+    #---------------------------------------------------------------------------------------------#
+    def stddev(self) -> float:
+        if self.count == 0:
+            return 0.0
+        return math.sqrt(self.m2 / self.count)
+
+#-------------------------------------------------------------------------------------------------#
+#                                           Aggregator                                            #
+#-------------------------------------------------------------------------------------------------#
+class Aggregator:
+    """
+    Collects every reading of every sensor between two uploads.
+
+    add() is called for each advertisement. When the sampling policy accepts a
+    reading, take() returns the reading with the window's mean in place of the single
+    values and min, max, stddev and sample count added, and starts a new window.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, precision: int = AGGREGATE_PRECISION) -> None:
+        self.precision = precision
+        self._windows = {}  # MAC -> {field: RunningStats}
+
+    #---------------------------------------------------------------------------------------------#
+    # add - Adds a reading to the sensor's window                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def add(self, mac_address: str, sensor_data: dict) -> None:
+        window = self._windows.get(mac_address)
+
+        # Is this the sensor's first reading?
+        if window is None:
+            # Yes...
+            window = {field: RunningStats() for field in AGGREGATE_FIELDS}
+            self._windows[mac_address] = window
+
+        for field in AGGREGATE_FIELDS:
+            value = sensor_data.get(field)
+            if value is not None:
+                window[field].add(value)
+
+    #---------------------------------------------------------------------------------------------#
+    # take - Returns the aggregated reading of the sensor and starts a new window                 #
+    #---------------------------------------------------------------------------------------------#
+    def take(self, mac_address: str, sensor_data: dict) -> dict:
+        window = self._windows.get(mac_address)
+        if window is None:
+            return sensor_data
+
+        aggregated = dict(sensor_data)
+        samples = 0
+
+        for field in AGGREGATE_FIELDS:
+            stats = window[field]
+            if stats.count == 0:
+                continue
+
+            samples = max(samples, stats.count)
+            aggregated[field] = round(stats.mean, self.precision)
+            aggregated[f"{field}_min"] = stats.min
+            aggregated[f"{field}_max"] = stats.max
+            aggregated[f"{field}_stddev"] = round(stats.stddev(), self.precision)
+            stats.reset()
+
+        aggregated['samples'] = samples
+        return aggregated
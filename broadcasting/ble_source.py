@@ -0,0 +1,356 @@
+import asyncio
+import threading
+import time
+
+import globals
+from constants import *
+from broadcasting.sensor_readers import RunFlag, RuuviReader
+from cloud.resilience import Backoff
+
+#-------------------------------------------------------------------------------------------------#
+#                                            BleSource                                            #
+#-------------------------------------------------------------------------------------------------#
+class BleSource:
+    """
+    Shares one Ruuvi scan between every part of the application that needs readings.
+
+    The readings come from a SensorReader: real Ruuvi sensors by default, or a replay
+    or synthetic reader for testing. The reader blocks, so it runs in a reader thread
+    that hands each reading to the asyncio loop. Every subscriber has its own queue and can be closed
+    on its own, so the sensors dialog can scan while broadcasting is running. The reader
+    thread runs only while there are subscribers. The sensor registry is updated once
+    per reading before the subscribers get it.
+
+    Readers that see the raw advertisements ask the BLE source before decoding one,
+    and an advertisement that no subscriber wants is skipped. Only the wanted readings
+    reach the registry.
+
+    A registry watch, e.g. the sensor dashboard's, keeps the followed sensors in the
+    registry up to date without a queue of its own. It keeps the reader running, but
+    doesn't turn off the filter, because it wants only the followed sensors.
+
+    A reader that fails or stops by itself, e.g. when the adapter is removed, is
+    started again after a backoff, and the error is shown by status_text().
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, loop: asyncio.AbstractEventLoop, registry=None, reader=None) -> None:
+        self.loop = loop
+        self.registry = registry
+        self.reader = reader if reader is not None else RuuviReader()
+        self.reader.wants = self._wants
+        self.reader.wanted = self._wanted
+        self._subscriptions = []
+        self._watches = []
+        self._wanting = ()      # Copy of the subscriptions for the reader thread
+        self._run_flag = None
+        self._thread = None
+
+        self._backoff = Backoff(BLE_RESTART_BASE_DELAY, BLE_RESTART_MAX_DELAY)
+        self._restart_handle = None     # Pending restart of a failed reader
+        self._restart_at = 0.0
+        self.reader_error = None        # Why the reader last failed, until it delivers a reading again
+
+        self.readings_metric = globals.metrics.counter("ble_readings_total", "Readings received from the sensor reader")
+        self.dropped_metric = globals.metrics.counter("ble_dropped_total", "Readings dropped because a subscriber fell behind")
+        self.skipped_metric = globals.metrics.counter("ble_skipped_total", "Advertisements no subscriber wanted, skipped before decoding")
+        self.reader_failures_metric = globals.metrics.counter("ble_reader_failures_total", "Times the sensor reader failed or stopped by itself")
+        globals.metrics.gauge("ble_subscribers", "Open BLE subscriptions", function=lambda: len(self._subscriptions))
+
+    #---------------------------------------------------------------------------------------------#
+    # subscribe - Returns a new subscription. Must be called in the asyncio loop.                 #
+    #---------------------------------------------------------------------------------------------#
+    def subscribe(self, macs=None, queue_size: int = BLE_QUEUE_SIZE, data_formats=None) -> "BleSubscription":
+        subscription = BleSubscription(self, macs, queue_size, data_formats)
+        self._subscriptions.append(subscription)
+        self._wanting = tuple(self._subscriptions)
+        self._ensure_reader()
+
+        return subscription
+
+    #---------------------------------------------------------------------------------------------#
+    # watch - Returns a new registry watch. Must be called in the asyncio loop.                   #
+    #---------------------------------------------------------------------------------------------#
+    def watch(self) -> "BleWatch":
+        watch = BleWatch(self)
+        self._watches.append(watch)
+        self._ensure_reader()
+
+        return watch
+
+    #---------------------------------------------------------------------------------------------#
+    # _unsubscribe - Removes a subscription or a watch. The reader stops with the last one.       #
+    #---------------------------------------------------------------------------------------------#
+    def _unsubscribe(self, subscription) -> None:
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+            self._wanting = tuple(self._subscriptions)
+        if subscription in self._watches:
+            self._watches.remove(subscription)
+
+        if not self._subscriptions and not self._watches and self._run_flag is not None:
+            self._run_flag.running = False
+
+    #---------------------------------------------------------------------------------------------#
+    # _ensure_reader - Starts the reader thread, or keeps it running if it is stopping            #
+    #---------------------------------------------------------------------------------------------#
+    def _ensure_reader(self) -> None:
+        # Is the reader thread running?
+        if self._thread is None:
+            # No...
+            # A failed reader is started again when its backoff has passed
+            if self._restart_handle is None:
+                self._start_reader()
+        else:
+            # Yes...
+            # Keep it running even if the last subscriber just asked it to stop
+            self._run_flag.running = True
+
+    #---------------------------------------------------------------------------------------------#
+    # _start_reader - Starts the reader thread                                                    #
+    #---------------------------------------------------------------------------------------------#
+    def _start_reader(self) -> None:
+        self._run_flag = RunFlag()
+        self._thread = threading.Thread(target=self._reader, args=(self._run_flag,), name="ble-reader", daemon=True)
+        self._thread.start()
+
+    #---------------------------------------------------------------------------------------------#
+    # _reader - Reader thread                                                                     #
+    #---------------------------------------------------------------------------------------------#
+    def _reader(self, run_flag: RunFlag) -> None:
+        error = None
+        try:
+            self.reader.run(self._on_data, run_flag)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            self.loop.call_soon_threadsafe(self._on_reader_exit, threading.current_thread(), run_flag.running, error)
+
+    #---------------------------------------------------------------------------------------------#
+    # _wants - Tells if any subscriber wants an advertisement. Runs in the reader thread.         #
+    #---------------------------------------------------------------------------------------------#
+    def _wants(self, mac_address: str, data_format) -> bool:
+        for subscription in self._wanting:
+            if subscription._wants(mac_address, data_format):
+                return True
+
+        # The registry watches want the followed sensors
+        if self._watches and self.registry is not None and self.registry.is_followed(mac_address):
+            return True
+
+        self.skipped_metric.inc()
+        return False
+
+    #---------------------------------------------------------------------------------------------#
+    # _wanted - Returns the (mac_addresses, data_formats) any subscriber wants, None meaning all  #
+    #           of them. Holds are left out. Runs in the reader thread.                           #
+    #---------------------------------------------------------------------------------------------#
+    def _wanted(self) -> tuple:
+        macs = set()
+        data_formats = set()
+
+        for subscription in self._wanting:
+            if subscription.closed:
+                continue
+            macs = None if macs is None or subscription.macs is None else macs | subscription.macs
+            data_formats = (
+                None if data_formats is None or subscription.data_formats is None
+                else data_formats | subscription.data_formats
+            )
+
+        # The registry watches want the followed sensors in any data format
+        if self._watches and self.registry is not None:
+            if macs is not None:
+                macs |= set(self.registry.followed())
+            data_formats = None
+
+        return (
+            None if macs is None else frozenset(macs),
+            None if data_formats is None else frozenset(data_formats),
+        )
+
+    #---------------------------------------------------------------------------------------------#
+    # _on_data - Callback function for the reader. Runs in the reader thread.                     #
+    #---------------------------------------------------------------------------------------------#
+    def _on_data(self, found_data) -> None:
+        self.loop.call_soon_threadsafe(self._dispatch, found_data)
+
+    #---------------------------------------------------------------------------------------------#
+    # _dispatch - Hands a reading to every subscriber. Runs in the asyncio loop.                  #
+    #---------------------------------------------------------------------------------------------#
+    def _dispatch(self, found_data) -> None:
+        self.readings_metric.inc()
+
+        # Has the reader recovered from a failure?
+        if self.reader_error is not None:
+            # Yes...
+            self.reader_error = None
+            self._backoff.reset()
+
+        if self.registry is not None:
+            self.registry.update(found_data[0], found_data[1])
+
+        for subscription in self._subscriptions:
+            subscription._offer(found_data)
+
+    #---------------------------------------------------------------------------------------------#
+    # _on_reader_exit - Restarts the reader if someone subscribed while it was stopping, or after #
+    #                   a backoff if it failed or stopped by itself                               #
+    #---------------------------------------------------------------------------------------------#
+    def _on_reader_exit(self, thread: threading.Thread, still_running: bool, error: str | None) -> None:
+        if self._thread is not thread:
+            return
+
+        self._thread = None
+        self._run_flag = None
+
+        if not self._subscriptions and not self._watches:
+            return
+
+        # Was the reader asked to stop?
+        if not still_running and error is None:
+            # Yes...
+            self._start_reader()
+            return
+
+        # No...
+        self.reader_error = error or "stopped"
+        self.reader_failures_metric.inc()
+
+        delay = self._backoff.next_delay()
+        self._restart_at = time.monotonic() + delay
+        self._restart_handle = self.loop.call_later(delay, self._restart_reader)
+
+    #---------------------------------------------------------------------------------------------#
+    # _restart_reader - Starts a failed reader again if it is still needed                        #
+    #---------------------------------------------------------------------------------------------#
+    def _restart_reader(self) -> None:
+        self._restart_handle = None
+
+        if self._thread is None and (self._subscriptions or self._watches):
+            self._start_reader()
+
+    #---------------------------------------------------------------------------------------------#
+    # status_text - Returns the reader's failure as text, or None if it is working                #
+    #---------------------------------------------------------------------------------------------#
+    def status_text(self) -> str | None:
+        if self.reader_error is None:
+            return None
+
+        # Is the restart pending?
+        if self._restart_handle is not None:
+            # Yes...
+            retry_in = max(0, self._restart_at - time.monotonic())
+            return f"Scanner failed ({self.reader_error}), restart in {retry_in:.0f} s"
+
+        # No...
+        return f"Scanner failed ({self.reader_error}), restarted"
+
+#-------------------------------------------------------------------------------------------------#
+#                                            BleWatch                                             #
+#-------------------------------------------------------------------------------------------------#
+class BleWatch:
+    """
+    Keeps the followed sensors in the registry up to date until it is closed. Unlike a
+    subscription it has no queue, so there is nothing to read and nothing is dropped.
+    """
+
+    def __init__(self, source: BleSource) -> None:
+        self.source = source
+        self.closed = False
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.source._unsubscribe(self)
+
+#-------------------------------------------------------------------------------------------------#
+#                                         BleSubscription                                         #
+#-------------------------------------------------------------------------------------------------#
+class BleSubscription:
+    """
+    Asynchronous iterator over the (mac_address, sensor_data) readings of a BleSource.
+
+    Only readings of the given MAC addresses and data formats are delivered, or all
+    readings if macs or data_formats is empty. A subscriber can also hold a sensor,
+    i.e. skip its readings until a given time. When the subscriber falls behind, the
+    oldest queued reading is dropped.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, source: BleSource, macs, queue_size: int, data_formats=None) -> None:
+        self.source = source
+        self.macs = set(macs) if macs else None
+        self.data_formats = frozenset(data_formats) if data_formats else None
+        self._holds = {}        # MAC -> UNIX time until the sensor's readings are skipped
+        self.dropped = 0
+        self.closed = False
+        self._queue = asyncio.Queue(maxsize=queue_size)
+
+    #---------------------------------------------------------------------------------------------#
+    # close - Stops the subscription. A waiting iterator ends.                                    #
+    #---------------------------------------------------------------------------------------------#
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        self.closed = True
+        self.source._unsubscribe(self)
+
+        # Wake up the iterator
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    #---------------------------------------------------------------------------------------------#
+    # hold - Skips the readings of a sensor until the given UNIX time                             #
+    #---------------------------------------------------------------------------------------------#
+    def hold(self, mac_address: str, until: float) -> None:
+        self._holds[mac_address] = until
+
+    #---------------------------------------------------------------------------------------------#
+    # _wants - Tells if this subscriber wants a reading. Also called from the reader thread.      #
+    #---------------------------------------------------------------------------------------------#
+    def _wants(self, mac_address: str, data_format) -> bool:
+        if self.closed:
+            return False
+        if self.macs is not None and mac_address not in self.macs:
+            return False
+        if self.data_formats is not None and data_format not in self.data_formats:
+            return False
+
+        until = self._holds.get(mac_address)
+        return until is None or time.time() >= until
+
+    #---------------------------------------------------------------------------------------------#
+    # _offer - Queues a reading if this subscriber wants it                                       #
+    #---------------------------------------------------------------------------------------------#
+    def _offer(self, found_data) -> None:
+        if not self._wants(found_data[0], found_data[1].get('data_format')):
+            return
+
+        # Is the subscriber behind?
+        if self._queue.full():
+            # Yes...
+            # Drop the oldest reading
+            self._queue.get_nowait()
+            self.dropped += 1
+            self.source.dropped_metric.inc()
+
+        self._queue.put_nowait(found_data)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self._queue.empty():
+            raise StopAsyncIteration
+
+        found_data = await self._queue.get()
+        if found_data is None:
+            raise StopAsyncIteration
+        return found_data
@@ -0,0 +1,338 @@
+import asyncio
+import time
+
+import globals
+from constants import *
+from broadcasting.upload_queue import UploadQueue
+from broadcasting.spool import Spool, SpoolDrainer
+from broadcasting.sampling_policy import SamplingPolicy
+from broadcasting.aggregator import Aggregator
+from broadcasting import wire_format
+from cloud.firebase_app import ensure_firebase
+from cloud.resilience import CircuitBreaker, OPEN, ERROR_KINDS
+from cloud.token_manager import TokenManager
+from storage.history_store import HistoryStore
+
+#-------------------------------------------------------------------------------------------------#
+#                                           Broadcaster                                           #
+#-------------------------------------------------------------------------------------------------#
+class Broadcaster:
+    """
+    Scans Ruuvi advertisements and uploads the readings to Firebase.
+
+    Everything runs as tasks in the asyncio loop. The scan task adds every reading of
+    the shared BLE source to the aggregator, and when the sampling policy accepts a
+    reading, puts the aggregate of the readings since the last upload in the upload
+    queue. Upload workers store them in the spool, the spool drainer sends them to
+    Firebase and the token manager keeps the ID token fresh. The broadcaster has no
+    user interface, so it is used by both the broadcasting dialog and the headless mode.
+    Every reading is also stored in the local history.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self) -> None:
+        self.spool = None
+        self.token_manager = None
+        self.drainer = None
+        self.breaker = None
+        self.upload_queue = None
+        self.sampling_policy = None
+        self.aggregator = None
+        self.history = None
+        self.encode_values = None
+        self.subscription = None
+        self.scan_task = None
+        self.hold_suppressed = False
+        self.reading_errors = 0         # Readings that raised an error in send_sensor_data
+        self.last_reading_error = None
+
+        # Metrics
+        metrics = globals.metrics
+        self.callback_time = metrics.histogram("broadcast_callback_seconds", "Time spent in send_sensor_data per reading")
+        self.discarded_metric = metrics.counter(
+            "readings_discarded_total", "Readings that can't be uploaded", labels={'reason': "data_format"}
+        )
+        self.accepted_metric = metrics.counter(
+            "sampling_decisions_total", "Sampling policy decisions", labels={'decision': "upload"}
+        )
+        self.suppressed_metric = metrics.counter(
+            "sampling_decisions_total", "Sampling policy decisions", labels={'decision': "suppress"}
+        )
+        self.upload_time = metrics.histogram("upload_seconds", "Duration of the Firebase updates")
+        self.uploaded_metric = metrics.counter("uploaded_readings_total", "Readings uploaded to Firebase")
+        self.upload_failure_metric = metrics.counter("upload_failures_total", "Failed Firebase updates")
+        self.reading_error_metric = metrics.counter("reading_errors_total", "Readings that failed in send_sensor_data")
+
+    #---------------------------------------------------------------------------------------------#
+    # start - Starts the upload pipeline and the scan task. Must be called in the asyncio loop.   #
+    #         Raises sqlite3.Error or OSError if the spool or the history can't be opened, and    #
+    #         ValueError if a setting is invalid.                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def start(self) -> None:
+        # Usually done already by the preload at start-up
+        ensure_firebase()
+
+        self.encode_values = wire_format.encoder(globals.settings.get('wire_format', WIRE_FORMAT))
+
+        # Every accepted reading is stored in the spool before it is uploaded
+        self.spool = Spool(
+            SPOOL_PATH,
+            max_readings=globals.settings.get('spool_max_readings', SPOOL_MAX_READINGS),
+            max_age=globals.settings.get('spool_max_age', SPOOL_MAX_AGE),
+        )
+
+        if globals.settings.get('history', True):
+            self.history = HistoryStore(
+                HISTORY_PATH,
+                max_days=globals.settings.get('history_max_days', HISTORY_MAX_DAYS),
+            )
+
+        # Start the upload pipeline before the scan task starts producing readings
+        self.token_manager = TokenManager(globals.auth)
+        self.token_manager.start()
+
+        # Failed uploads are retried with a backoff, and not at all while Firebase is down
+        self.breaker = CircuitBreaker(
+            failure_threshold=globals.settings.get('circuit_failure_threshold', CIRCUIT_FAILURE_THRESHOLD),
+            base_delay=globals.settings.get('retry_base_delay', RETRY_BASE_DELAY),
+            max_delay=globals.settings.get('retry_max_delay', RETRY_MAX_DELAY),
+        )
+
+        self.drainer = SpoolDrainer(
+            self.spool,
+            self.upload_sensor_data,
+            batch_size=globals.settings.get('upload_batch_size', UPLOAD_BATCH_SIZE),
+            breaker=self.breaker,
+            on_auth_error=self.token_manager.refresh,
+        )
+        self.drainer.start()
+
+        self.upload_queue = UploadQueue(
+            self.spool_sensor_data,
+            workers=globals.settings.get('upload_workers', UPLOAD_WORKERS),
+            max_size=globals.settings.get('upload_queue_size', UPLOAD_QUEUE_SIZE),
+            policy=globals.settings.get('upload_queue_policy', UPLOAD_QUEUE_POLICY),
+            batch_size=globals.settings.get('upload_batch_size', UPLOAD_BATCH_SIZE),
+            batch_window=globals.settings.get('upload_batch_window', UPLOAD_BATCH_WINDOW),
+        )
+        self.upload_queue.start()
+
+        self.sampling_policy = SamplingPolicy(globals.settings)
+        if globals.settings.get('aggregate_readings', AGGREGATE_READINGS):
+            self.aggregator = Aggregator()
+
+        # The queue gauges are read only when the metrics are exported
+        globals.metrics.gauge("upload_queue_depth", "Readings waiting in the upload queue", function=self.upload_queue.depth)
+        globals.metrics.counter(
+            "upload_queue_dropped_total", "Readings dropped from the full upload queue",
+            function=lambda: self.upload_queue.dropped
+        )
+        globals.metrics.gauge("spool_pending", "Readings in the spool waiting for upload", function=self.spool.pending)
+        globals.metrics.counter(
+            "spool_evicted_total", "Readings evicted from the full spool", function=lambda: self.spool.evicted
+        )
+        globals.metrics.counter(
+            "spool_rejected_total", "Readings rejected by Firebase and moved to the dead letters",
+            function=lambda: self.spool.rejected
+        )
+        for kind in ERROR_KINDS:
+            globals.metrics.counter(
+                "upload_errors_total", "Failed Firebase updates per error kind",
+                labels={'kind': kind}, function=lambda kind=kind: self.drainer.errors[kind]
+            )
+        globals.metrics.gauge(
+            "firebase_circuit_open", "1 while Firebase is considered down", function=lambda: int(self.breaker.state == OPEN)
+        )
+        globals.metrics.counter(
+            "firebase_circuit_opened_total", "Times Firebase was considered down", function=lambda: self.breaker.opened
+        )
+
+        # Without the history and the aggregator, a reading the sampling policy is sure to
+        # reject isn't needed at all, so the readers skip it before decoding
+        self.hold_suppressed = self.history is None and self.aggregator is None
+
+        # Start scanning
+        self.subscription = globals.ble_source.subscribe(globals.sensors.followed(), data_formats=UPLOAD_DATA_FORMATS)
+        self.scan_task = asyncio.ensure_future(self.send_sensor_data_task())
+
+        globals.broadcaster = self
+
+    #---------------------------------------------------------------------------------------------#
+    # stop - Stops scanning and the upload pipeline in order. Readings that are not uploaded yet  #
+    #        stay in the spool.                                                                   #
+    #---------------------------------------------------------------------------------------------#
+    async def stop(self) -> None:
+        if globals.broadcaster is self:
+            globals.broadcaster = None
+
+        # Stop scanning
+        if self.subscription is not None:
+            self.subscription.close()
+        if self.scan_task is not None:
+            await asyncio.gather(self.scan_task, return_exceptions=True)
+
+        if self.upload_queue is not None:
+            await self.upload_queue.stop(flush=True)  # Readings still in memory go to the spool
+        if self.drainer is not None:
+            await self.drainer.stop()
+        if self.token_manager is not None:
+            await self.token_manager.stop()
+        if self.spool is not None:
+            self.spool.close()
+        if self.history is not None:
+            self.history.close()
+
+    #---------------------------------------------------------------------------------------------#
+    # stats - Returns the upload pipeline counters                                                #
+    #---------------------------------------------------------------------------------------------#
+    def stats(self) -> dict:
+        queue_stats = self.upload_queue.stats()
+        http_stats = globals.http_session.stats()
+
+        return {
+            'queue': queue_stats['depth'],
+            'spooled': self.spool.pending(),
+            'uploaded': self.drainer.uploaded,
+            'dropped': queue_stats['dropped'] + self.spool.evicted + self.spool.rejected,
+            'unchanged': self.sampling_policy.suppressed,
+            'failed': self.drainer.failed,
+            'requests': http_stats['requests'],
+            'connections': http_stats['connections'],
+            'firebase': self.breaker.status_text(),
+            'token_error': self.token_manager.last_error,
+            'scanner': globals.ble_source.status_text(),
+            'errors': self.reading_errors,
+            'last_error': self.last_reading_error,
+            'scan_error': self.scan_error(),
+        }
+
+    #---------------------------------------------------------------------------------------------#
+    # status_text - Returns the upload pipeline counters as text                                  #
+    #---------------------------------------------------------------------------------------------#
+    def status_text(self) -> str:
+        stats = self.stats()
+        return (
+            f"Queue: {stats['queue']}  Spool: {stats['spooled']}  Sent: {stats['uploaded']}  "
+            f"Dropped: {stats['dropped']}  Failed: {stats['failed']}\n"
+            f"Unchanged: {stats['unchanged']}  Requests: {stats['requests']}  Connections: {stats['connections']}  "
+            f"Errors: {stats['errors']}" + (f" ({stats['last_error']})" if stats['last_error'] else "") + "\n"
+            f"Firebase: {stats['firebase']}"
+            + (f"  Token refresh failed ({stats['token_error']})" if stats['token_error'] else "")
+            + (f"\n{stats['scanner']}" if stats['scanner'] else "")
+            + (f"\nBroadcasting stopped ({stats['scan_error']})" if stats['scan_error'] else "")
+        )
+
+    #---------------------------------------------------------------------------------------------#
+    # scan_error - Returns why the scan task has ended, or None if it is running or was stopped   #
+    #---------------------------------------------------------------------------------------------#
+    def scan_error(self) -> str | None:
+        if self.scan_task is None or not self.scan_task.done() or self.subscription.closed:
+            return None
+        if self.scan_task.cancelled():
+            return "cancelled"
+
+        error = self.scan_task.exception()
+        if error is None:
+            return "scan ended"
+        return f"{type(error).__name__}: {error}"
+
+    #---------------------------------------------------------------------------------------------#
+    # send_sensor_data_task - Task for sending Ruuvi-data                                         #
+    #---------------------------------------------------------------------------------------------#
+    async def send_sensor_data_task(self):
+        async for found_data in self.subscription:
+            # A reading that fails, e.g. because the history can't be written, is
+            # counted and skipped, so the following readings are still handled
+            try:
+                self.send_sensor_data(found_data)
+            except Exception as e:
+                self.reading_errors += 1
+                self.last_reading_error = f"{type(e).__name__}: {e}"
+                self.reading_error_metric.inc()
+
+    #---------------------------------------------------------------------------------------------#
+    # send_sensor_data - Callback function for sending Ruuvi data                                 #
+    #---------------------------------------------------------------------------------------------#
+    def send_sensor_data(self, found_data):
+        started = time.perf_counter()
+        mac_address, sensor_data = found_data
+
+        if sensor_data['data_format'] not in UPLOAD_DATA_FORMATS:
+            self.discarded_metric.inc()
+            return
+
+        current_time = time.time()
+        record = globals.sensors.get(mac_address)
+
+        if self.history is not None:
+            self.history.append(mac_address, current_time, sensor_data)
+
+        if self.aggregator is not None:
+            self.aggregator.add(mac_address, sensor_data)
+
+        if self.sampling_policy.should_upload(record, sensor_data, current_time):
+            if self.aggregator is not None:
+                sensor_data = self.aggregator.take(mac_address, sensor_data)
+
+            # The upload workers do the I/O, so the scan task is never blocked
+            self.upload_queue.put(mac_address, sensor_data, current_time)
+            self.accepted_metric.inc()
+
+            # Nothing is uploaded from the sensor before the interval has passed
+            if self.hold_suppressed:
+                self.subscription.hold(mac_address, current_time + self.sampling_policy.rule(mac_address).interval)
+        else:
+            self.suppressed_metric.inc()
+
+        self.callback_time.observe(time.perf_counter() - started)
+
+    #---------------------------------------------------------------------------------------------#
+    # spool_sensor_data - Stores a batch of readings in the spool. Runs in an upload worker.      #
+    #---------------------------------------------------------------------------------------------#
+    async def spool_sensor_data(self, batch):
+        db = globals.firebase.database()
+
+        readings = []
+        for mac_address, sensor_data, timestamp in batch:
+            values = self.encode_values(sensor_data, timestamp)
+
+            # The push key is generated here, so a replayed reading overwrites
+            # itself instead of creating a duplicate history entry.
+            readings.append((mac_address, db.generate_key(), timestamp, values))
+
+        await asyncio.to_thread(self.spool.append, readings)
+        self.drainer.notify()
+
+    #---------------------------------------------------------------------------------------------#
+    # upload_sensor_data - Uploads a batch of spooled readings with one update. Runs in the       #
+    #                      spool drainer.                                                         #
+    #---------------------------------------------------------------------------------------------#
+    async def upload_sensor_data(self, readings):
+        token = await self.token_manager.ensure_token()
+
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self.send_update, readings, token)
+        except Exception:
+            self.upload_failure_metric.inc()
+            raise
+
+        self.upload_time.observe(time.perf_counter() - started)
+        self.uploaded_metric.inc(len(readings))
+
+        # The dashboard shows when each sensor's readings last reached Firebase
+        sent = time.time()
+        for mac_address, _, _ in readings:
+            record = globals.sensors.get(mac_address)
+            if record is not None:
+                record.last_sent = sent
+
+    #---------------------------------------------------------------------------------------------#
+    # send_update - Sends the readings as one multi-location update. Runs in a worker thread.     #
+    #---------------------------------------------------------------------------------------------#
+    def send_update(self, readings, token):
+        # The history entries and the new values of every reading go to the
+        # device node in one multi-location update.
+        globals.device_node.update(readings, token)
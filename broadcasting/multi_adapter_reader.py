@@ -0,0 +1,337 @@
+import math
+import multiprocessing
+import queue
+import signal
+import time
+from contextlib import closing
+
+import globals
+from constants import *
+from broadcasting.sensor_readers import SensorReader, RuuviReader
+
+#-------------------------------------------------------------------------------------------------#
+#                                       MultiAdapterReader                                        #
+#-------------------------------------------------------------------------------------------------#
+class MultiAdapterReader(SensorReader):
+    """
+    Reads Ruuvi advertisements with several Bluetooth adapters at once.
+
+    Every adapter (e.g. "hci0", "hci1") is read by a RuuviReader in its own worker
+    process, so the capture rate grows with the adapters and the CPU cores. The
+    workers send their readings to this reader, which drops the copies of an
+    advertisement caught by several adapters and keeps the one with the strongest
+    signal. The adapter of the kept copy owns the sensor until another adapter hears
+    it better. A worker that stops, e.g. because its adapter was unplugged, is started
+    again after restart_delay seconds. With record_path, the kept copies are written
+    to the capture file, so a replay gives the same readings as the live scan.
+
+    The workers skip the unwanted advertisements before decoding them. Every worker
+    gets the wanted MAC addresses and data formats when it starts and through a queue
+    whenever they change. The holds are left to the BLE source.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, adapters: list, record_path: str | None = None,
+                 dedupe_window: float = BLE_DEDUPE_WINDOW, restart_delay: float = BLE_ADAPTER_RESTART_DELAY) -> None:
+        self.adapters = list(adapters)
+        self.record_path = record_path
+        self.restart_delay = restart_delay
+        self.deduplicator = AdvertisementDeduplicator(dedupe_window)
+
+        self.readings_metrics = {
+            adapter: globals.metrics.counter(
+                "ble_adapter_readings_total", "Readings received per Bluetooth adapter", labels={'adapter': adapter}
+            )
+            for adapter in self.adapters
+        }
+        globals.metrics.counter(
+            "ble_duplicates_total", "Advertisements caught by more than one adapter",
+            function=lambda: self.deduplicator.duplicates
+        )
+        for adapter in self.adapters:
+            globals.metrics.gauge(
+                "ble_adapter_owned_sensors", "Sensors heard best by each Bluetooth adapter",
+                labels={'adapter': adapter}, function=lambda adapter=adapter: self.deduplicator.owned_by(adapter)
+            )
+
+    #---------------------------------------------------------------------------------------------#
+    # run - Runs the adapter workers and merges their readings until stopped                      #
+    #---------------------------------------------------------------------------------------------#
+    def run(self, callback, run_flag) -> None:
+        # fork isn't safe with the threads of the asyncio loop and urwid
+        context = multiprocessing.get_context("spawn")
+        readings = context.Queue(maxsize=BLE_QUEUE_SIZE * len(self.adapters))
+        stop_event = context.Event()
+
+        workers = {}
+        filter_queues = {}      # Adapter -> queue of the worker's wanted sensors
+        restart_at = dict.fromkeys(self.adapters, 0.0)
+        wanted = self._current_wanted()
+        next_filter_check = time.monotonic() + BLE_FILTER_INTERVAL
+        capture = open(self.record_path, "a") if self.record_path is not None else None
+
+        try:
+            while run_flag.running:
+                now = time.monotonic()
+
+                # Have the wanted sensors changed?
+                if now >= next_filter_check:
+                    next_filter_check = now + BLE_FILTER_INTERVAL
+                    current = self._current_wanted()
+                    if current != wanted:
+                        # Yes...
+                        wanted = current
+                        for filter_queue in filter_queues.values():
+                            filter_queue.put(wanted)
+
+                # Start the workers that are not running
+                for adapter in self.adapters:
+                    worker = workers.get(adapter)
+                    if worker is not None and worker.is_alive():
+                        continue
+
+                    # Has the worker just stopped?
+                    if worker is not None:
+                        # Yes...
+                        workers[adapter] = None
+                        _close_queue(filter_queues.pop(adapter))
+                        restart_at[adapter] = now + self.restart_delay
+                        continue
+
+                    if now >= restart_at[adapter]:
+                        filter_queues[adapter] = context.Queue()
+                        worker = context.Process(
+                            target=_adapter_worker,
+                            args=(adapter, readings, stop_event, filter_queues[adapter], wanted),
+                            name=f"ble-{adapter}",
+                            daemon=True,
+                        )
+                        worker.start()
+                        workers[adapter] = worker
+
+                # Wait for a reading, but not past the moment a held one is due
+                timeout = 0.1
+                deadline = self.deduplicator.next_deadline()
+                if deadline is not None:
+                    timeout = min(timeout, max(0, deadline - now))
+
+                try:
+                    adapter, found_data, raw, timestamp = readings.get(timeout=timeout)
+                except queue.Empty:
+                    pass
+                else:
+                    self.readings_metrics[adapter].inc()
+                    self.deduplicator.add(adapter, found_data, time.monotonic(), (raw, timestamp))
+
+                for found_data, (raw, timestamp) in self.deduplicator.ready(time.monotonic()):
+                    # Is the scan recorded?
+                    if capture is not None:
+                        # Yes...
+                        capture.write(f"{timestamp:.3f} {found_data[0]} {raw}\n")
+                    callback(found_data)
+        finally:
+            stop_event.set()
+
+            if capture is not None:
+                capture.close()
+
+            # A worker waiting for an advertisement doesn't see the stop event
+            for worker in workers.values():
+                if worker is None:
+                    continue
+                worker.join(timeout=1)
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+
+            for filter_queue in filter_queues.values():
+                _close_queue(filter_queue)
+            _close_queue(readings)
+
+    #---------------------------------------------------------------------------------------------#
+    # _current_wanted - Returns the wanted (mac_addresses, data_formats), None meaning all        #
+    #---------------------------------------------------------------------------------------------#
+    def _current_wanted(self) -> tuple:
+        if self.wanted is None:
+            return (None, None)
+        return self.wanted()
+
+#-------------------------------------------------------------------------------------------------#
+#                                    AdvertisementDeduplicator                                    #
+#-------------------------------------------------------------------------------------------------#
+class AdvertisementDeduplicator:
+    """
+    Merges the copies of one advertisement caught by several adapters.
+
+    A new advertisement is held for `window` seconds. Copies arriving meanwhile replace
+    it if their RSSI is stronger, and copies arriving later, up to `memory` seconds,
+    are dropped. Data format 5 advertisements are told apart by their measurement
+    sequence number, older formats by their values. Every copy can carry extra data,
+    e.g. its raw advertisement, which is released with the kept copy.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, window: float = BLE_DEDUPE_WINDOW, memory: float = BLE_DEDUPE_MEMORY) -> None:
+        self.window = window
+        self.memory = memory
+
+        # Both dicts are in time order, because every entry gets the same delay
+        self._pending = {}      # Key -> [deadline, adapter, found_data, extra]
+        self._released = {}     # Key -> time until late copies are dropped
+
+        self.owners = {}        # MAC -> adapter that heard the sensor best
+        self.duplicates = 0
+
+    #---------------------------------------------------------------------------------------------#
+    # add - Adds a copy of an advertisement                                                       #
+    #---------------------------------------------------------------------------------------------#
+    def add(self, adapter: str, found_data, now: float, extra=None) -> None:
+        key = _advertisement_key(found_data)
+
+        # Is the advertisement held already?
+        entry = self._pending.get(key)
+        if entry is not None:
+            # Yes...
+            self.duplicates += 1
+            if _rssi(found_data) > _rssi(entry[2]):
+                entry[1] = adapter
+                entry[2] = found_data
+                entry[3] = extra
+            return
+
+        # Has it been released already?
+        expiry = self._released.get(key)
+        if expiry is not None and expiry > now:
+            # Yes...
+            self.duplicates += 1
+            return
+
+        # No...
+        self._released.pop(key, None)
+        self._pending[key] = [now + self.window, adapter, found_data, extra]
+
+    #---------------------------------------------------------------------------------------------#
+    # ready - Returns the advertisements whose window has passed as (found_data, extra) tuples    #
+    #---------------------------------------------------------------------------------------------#
+    def ready(self, now: float) -> list:
+        # Forget the old released advertisements
+        while self._released:
+            key, expiry = next(iter(self._released.items()))
+            if expiry > now:
+                break
+            del self._released[key]
+
+        released = []
+        while self._pending:
+            key, (deadline, adapter, found_data, extra) = next(iter(self._pending.items()))
+            if deadline > now:
+                break
+
+            del self._pending[key]
+            self._released[key] = now + self.memory
+            self.owners[found_data[0]] = adapter
+            released.append((found_data, extra))
+
+        return released
+
+    #---------------------------------------------------------------------------------------------#
+    # next_deadline - Time when the oldest held advertisement is due, or None                     #
+    #---------------------------------------------------------------------------------------------#
+    def next_deadline(self) -> float | None:
+        if not self._pending:
+            return None
+        return next(iter(self._pending.values()))[0]
+
+    #---------------------------------------------------------------------------------------------#
+    # owned_by - Number of sensors an adapter owns                                                #
+    #---------------------------------------------------------------------------------------------#
+    def owned_by(self, adapter: str) -> int:
+        return sum(1 for owner in list(self.owners.values()) if owner == adapter)
+
+#-------------------------------------------------------------------------------------------------#
+#                                          _WorkerFilter                                          #
+#-------------------------------------------------------------------------------------------------#
+class _WorkerFilter:
+    """
+    The wants function of a worker's RuuviReader. Tells if the parent wants an
+    advertisement, and picks up the changes the parent puts in the filter queue at
+    most every BLE_FILTER_INTERVAL seconds.
+    """
+
+    def __init__(self, filter_queue, wanted: tuple) -> None:
+        self.filter_queue = filter_queue
+        self.macs, self.data_formats = wanted
+        self.next_check = time.monotonic() + BLE_FILTER_INTERVAL
+
+    def __call__(self, mac_address: str, data_format) -> bool:
+        now = time.monotonic()
+        if now >= self.next_check:
+            self.next_check = now + BLE_FILTER_INTERVAL
+            try:
+                while True:
+                    self.macs, self.data_formats = self.filter_queue.get_nowait()
+            except queue.Empty:
+                pass
+
+        if self.macs is not None and mac_address not in self.macs:
+            return False
+        return self.data_formats is None or data_format in self.data_formats
+
+#-------------------------------------------------------------------------------------------------#
+#                                           _EventRunFlag                                         #
+#-------------------------------------------------------------------------------------------------#
+class _EventRunFlag:
+    """
+    RunFlag of a worker process. Stops when the parent sets the stop event.
+    """
+
+    def __init__(self, stop_event) -> None:
+        self.stop_event = stop_event
+
+    @property
+    def running(self) -> bool:
+        return not self.stop_event.is_set()
+
+#-------------------------------------------------------------------------------------------------#
+# _adapter_worker - Worker process of one adapter                                                 #
+#-------------------------------------------------------------------------------------------------#
+def _adapter_worker(adapter: str, readings, stop_event, filter_queue, wanted: tuple) -> None:
+    # The parent process decides when the workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # The raw advertisement goes along, so the parent can record the copy it keeps
+    reader = RuuviReader(bt_device=adapter)
+    reader.wants = _WorkerFilter(filter_queue, wanted)
+    with closing(reader.read(_EventRunFlag(stop_event))) as adapter_readings:
+        for mac_address, sensor_data, raw in adapter_readings:
+            try:
+                readings.put_nowait((adapter, (mac_address, sensor_data), raw, time.time()))
+            except queue.Full:
+                pass    # The parent is behind. Newer advertisements will follow.
+
+#-------------------------------------------------------------------------------------------------#
+# _close_queue - Closes a queue without waiting for a stopped worker to read it                   #
+#-------------------------------------------------------------------------------------------------#
+def _close_queue(worker_queue) -> None:
+    worker_queue.cancel_join_thread()
+    worker_queue.close()
+
+#-------------------------------------------------------------------------------------------------#
+# _advertisement_key - Identifies an advertisement, so its copies have the same key               #
+#-------------------------------------------------------------------------------------------------#
+def _advertisement_key(found_data) -> tuple:
+    mac_address, sensor_data = found_data
+
+    sequence = sensor_data.get('measurement_sequence_number')
+    if sequence is not None:
+        return (mac_address, sequence)
+
+    return (mac_address, tuple(sorted((key, value) for key, value in sensor_data.items() if key != 'rssi')))
+
+def _rssi(found_data) -> float:
+    rssi = found_data[1].get('rssi')
+    return -math.inf if rssi is None else rssi
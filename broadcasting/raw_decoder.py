@@ -0,0 +1,97 @@
+import math
+import struct
+
+# Data format 5 (RAWv2) payload without the MAC address: format, temperature, humidity,
+# pressure, acceleration x/y/z, power info, movement counter, measurement sequence number
+RAWV2 = struct.Struct(">BhHHhhhHBH")
+RAWV2_LENGTH = 48      # Hex characters in the payload, MAC address included
+
+# Manufacturer specific data of a data format 5 advertisement: type FF, Ruuvi Innovations
+# company ID 0x0499 (little-endian) and the format byte
+RAWV2_PREFIX = "FF990405"
+
+#-------------------------------------------------------------------------------------------------#
+# split_advertisement - Returns (data_format, data) of a raw advertisement, like ruuvitag_sensor  #
+#                       DataFormats.convert_data. Data format 5 is found without ruuvitag_sensor. #
+#-------------------------------------------------------------------------------------------------#
+def split_advertisement(raw: str) -> tuple:
+    """
+    The advertisement is a length byte, length:type:data chunks and the RSSI byte.
+    The data of data format 5 is the payload followed by the RSSI, so decode_df5()
+    gets the same string as ruuvitag_sensor's decoder. Every other advertisement,
+    including the malformed ones, is left to ruuvitag_sensor.
+    """
+    try:
+        end = (int(raw[:2], 16) + 1) * 2
+        position = 2
+
+        while position < end:
+            chunk_start = position + 2
+            chunk_end = chunk_start + int(raw[position:chunk_start], 16) * 2
+            if chunk_end > end:
+                break
+
+            # Does the chunk have the data ruuvitag_sensor looks for?
+            if raw[chunk_start:chunk_start + 2] in ("FF", "16", "09"):
+                # Yes...
+                if raw.startswith(RAWV2_PREFIX, chunk_start):
+                    return (5, raw[chunk_start + 6:chunk_end] + raw[end:])
+                break
+
+            position = chunk_end
+    except ValueError:
+        pass
+
+    from ruuvitag_sensor.data_formats import DataFormats
+    return DataFormats.convert_data(raw)
+
+#-------------------------------------------------------------------------------------------------#
+# decode_df5 - Decodes data format 5. Returns the same dictionary as ruuvitag_sensor Df5Decoder,  #
+#              or None if the data is invalid.                                                    #
+#-------------------------------------------------------------------------------------------------#
+def decode_df5(data: str) -> dict | None:
+    try:
+        payload = bytes.fromhex(data[:RAWV2_LENGTH])
+        if len(payload) != RAWV2_LENGTH // 2:
+            return None
+        _, temperature, humidity, pressure, acc_x, acc_y, acc_z, power_info, movement_counter, sequence = \
+            RAWV2.unpack_from(payload)
+        rssi = int(data[RAWV2_LENGTH:], 16) if len(data) > RAWV2_LENGTH else None
+    except ValueError:
+        return None
+
+    if acc_x == -32768 or acc_y == -32768 or acc_z == -32768:
+        acc_x = acc_y = acc_z = acceleration = None
+    else:
+        acceleration = math.sqrt(acc_x * acc_x + acc_y * acc_y + acc_z * acc_z)
+
+    battery = power_info >> 5
+    tx_power = power_info & 0x1F
+
+    return {
+        'data_format': 5,
+        'humidity': None if humidity == 65535 else round(humidity / 400, 2),
+        'temperature': None if temperature == -32768 else round(temperature / 200, 2),
+        'pressure': None if pressure == 65535 else round((pressure + 50000) / 100, 2),
+        'acceleration': acceleration,
+        'acceleration_x': acc_x,
+        'acceleration_y': acc_y,
+        'acceleration_z': acc_z,
+        'tx_power': None if tx_power == 0x1F else -40 + tx_power * 2,
+        'battery': None if battery == 0x7FF else battery + 1600,
+        'movement_counter': movement_counter,
+        'measurement_sequence_number': sequence,
+        'mac': data[36:RAWV2_LENGTH].lower(),
+        'rssi': None if rssi is None else (rssi - 256 if rssi > 127 else rssi),
+    }
+
+#-------------------------------------------------------------------------------------------------#
+# decode_advertisement - Decodes the data returned by split_advertisement(). Returns None if it   #
+#                        is invalid.                                                              #
+#-------------------------------------------------------------------------------------------------#
+def decode_advertisement(data_format, data: str) -> dict | None:
+    if data_format == 5:
+        return decode_df5(data)
+
+    from ruuvitag_sensor.decoder import get_decoder
+    return get_decoder(data_format).decode_data(data)
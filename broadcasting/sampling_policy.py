@@ -0,0 +1,129 @@
+from constants import *
+
+# Values compared against the deadbands
+POLICY_FIELDS = ("temperature", "humidity", "pressure")
+
+#-------------------------------------------------------------------------------------------------#
+#                                          SamplingRule                                           #
+#-------------------------------------------------------------------------------------------------#
+class SamplingRule:
+    """
+    Upload rule of one sensor. interval and max_silence are in seconds. A deadband of
+    None means that changes in the value never trigger an upload.
+    """
+    __slots__ = ("interval", "max_silence", "deadbands")
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, interval: float, max_silence: float, deadbands: tuple) -> None:
+        self.interval = interval
+        self.max_silence = max_silence
+        self.deadbands = deadbands
+
+#-------------------------------------------------------------------------------------------------#
+#                                         SamplingPolicy                                          #
+#-------------------------------------------------------------------------------------------------#
+class SamplingPolicy:
+    """
+    Decides which readings are uploaded.
+
+    A reading is never uploaded sooner than `interval` after the previous upload of
+    the same sensor. After that it is uploaded only if temperature, humidity or
+    pressure has moved more than its deadband since the last uploaded reading, or if
+    nothing has been uploaded for `max_silence` seconds. Every sensor can override the
+    global values in settings['sensor_policies'], keyed by MAC address.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, settings: dict) -> None:
+        self.default_rule = self._make_rule(settings, {})
+        self.rules = {
+            mac_address: self._make_rule(settings, overrides)
+            for mac_address, overrides in settings.get('sensor_policies', {}).items()
+        }
+
+        self._last_values = {}  # MAC -> values of the last uploaded reading
+
+        # Counters
+        self.accepted = 0
+        self.suppressed = 0
+
+    #---------------------------------------------------------------------------------------------#
+    # rule - Returns the rule of a sensor                                                         #
+    #---------------------------------------------------------------------------------------------#
+    def rule(self, mac_address: str) -> SamplingRule:
+        return self.rules.get(mac_address, self.default_rule)
+
+    #---------------------------------------------------------------------------------------------#
+    # should_upload - Tells if a reading is uploaded. An accepted reading is recorded as the      #
+    #                 sensor's last upload.                                                       #
+    #---------------------------------------------------------------------------------------------#
+    def should_upload(self, record, sensor_data: dict, timestamp: float) -> bool:
+        rule = self.rules.get(record.mac_address, self.default_rule)
+        last_values = self._last_values.get(record.mac_address)
+
+        # Has anything been uploaded from this sensor?
+        if record.last_upload is None or last_values is None:
+            # No...
+            accept = True
+        else:
+            # Yes...
+            elapsed = timestamp - record.last_upload
+
+            if elapsed < rule.interval:
+                accept = False
+            elif elapsed >= rule.max_silence:
+                accept = True  # Heartbeat
+            else:
+                accept = self._changed(rule, last_values, sensor_data)
+
+        if not accept:
+            self.suppressed += 1
+            return False
+
+        record.last_upload = timestamp
+        self._last_values[record.mac_address] = tuple(sensor_data.get(field) for field in POLICY_FIELDS)
+        self.accepted += 1
+        return True
+
+    #---------------------------------------------------------------------------------------------#
+    # _changed - Tells if any value has moved more than its deadband                              #
+    #---------------------------------------------------------------------------------------------#
+    @staticmethod
+    def _changed(rule: SamplingRule, last_values: tuple, sensor_data: dict) -> bool:
+        for field, deadband, last_value in zip(POLICY_FIELDS, rule.deadbands, last_values):
+            if deadband is None:
+                continue
+
+            value = sensor_data.get(field)
+            if value is None or last_value is None:
+                # A value that appears or disappears is a change
+                if value is not last_value:
+                    return True
+                continue
+
+            if abs(value - last_value) > deadband:
+                return True
+
+        return False
+
+    #---------------------------------------------------------------------------------------------#
+    # _make_rule - Builds a rule from the per-sensor overrides and the global settings            #
+    #---------------------------------------------------------------------------------------------#
+    @staticmethod
+    def _make_rule(settings: dict, overrides: dict) -> SamplingRule:
+        def get(key, default):
+            return overrides.get(key, settings.get(key, default))
+
+        return SamplingRule(
+            interval=get('time_interval', 1) * 60,
+            max_silence=get('max_silence', SAMPLING_MAX_SILENCE),
+            deadbands=(
+                get('deadband_temperature', DEADBAND_TEMPERATURE),
+                get('deadband_humidity', DEADBAND_HUMIDITY),
+                get('deadband_pressure', DEADBAND_PRESSURE),
+            ),
+        )
@@ -0,0 +1,305 @@
+import os
+import random
+from abc import ABC, abstractmethod
+import time
+from contextlib import closing
+
+from broadcasting.raw_decoder import split_advertisement, decode_advertisement
+
+#-------------------------------------------------------------------------------------------------#
+#                                             RunFlag                                             #
+#-------------------------------------------------------------------------------------------------#
+class RunFlag:
+    """
+    Tells a running reader to stop. Works like ruuvitag_sensor's RunFlag, so it can be
+    passed to RuuviTagSensor.get_data without importing ruuvitag_sensor first.
+    """
+
+    def __init__(self) -> None:
+        self.running = True
+
+#-------------------------------------------------------------------------------------------------#
+#                                          SensorReader                                           #
+#-------------------------------------------------------------------------------------------------#
+class SensorReader(ABC):
+    """
+    Where the readings of a BleSource come from.
+
+    run() blocks in the BLE source's reader thread and calls callback((mac_address,
+    sensor_data)) for every reading until run_flag.running is False. The readings use
+    the same dictionaries as ruuvitag_sensor, so the scan and broadcast code can't tell
+    the readers apart. When run() returns while someone is still subscribed, the BLE
+    source starts it again.
+
+    The BLE source sets wants to a function (mac_address, data_format) -> bool that
+    tells if anyone wants an advertisement. Readers that see the raw advertisements
+    call it before decoding and skip the unwanted ones. The BLE source filters the
+    decoded readings too, so the other readers can ignore it. Readers that decode in
+    other processes can't call wants, so the BLE source also sets wanted to a function
+    that returns the wanted (mac_addresses, data_formats) as frozensets, None meaning
+    all of them.
+    """
+    wants = None
+    wanted = None
+
+    @abstractmethod
+    def run(self, callback, run_flag) -> None:
+        ...
+
+#-------------------------------------------------------------------------------------------------#
+#                                           RuuviReader                                           #
+#-------------------------------------------------------------------------------------------------#
+class RuuviReader(SensorReader):
+    """
+    Reads real Ruuvi advertisements with ruuvitag_sensor's bluez adapter and decodes
+    the wanted ones with the raw decoder. With record_path, every raw advertisement
+    is also written to a capture file that ReplayReader can play back.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, record_path: str | None = None, bt_device: str = "") -> None:
+        self.record_path = record_path
+        self.bt_device = bt_device
+
+    #---------------------------------------------------------------------------------------------#
+    # run - Reads advertisements until stopped                                                    #
+    #---------------------------------------------------------------------------------------------#
+    def run(self, callback, run_flag) -> None:
+        capture = open(self.record_path, "a") if self.record_path is not None else None
+
+        def record(mac_address, raw):
+            capture.write(f"{time.time():.3f} {mac_address} {raw}\n")
+
+        try:
+            with closing(self.read(run_flag, record if capture is not None else None)) as readings:
+                for mac_address, sensor_data, _ in readings:
+                    callback((mac_address, sensor_data))
+        finally:
+            if capture is not None:
+                capture.close()
+
+    #---------------------------------------------------------------------------------------------#
+    # read - Yields the wanted readings as (mac_address, sensor_data, raw) until stopped.         #
+    #        on_raw(mac_address, raw) is called for every advertisement, e.g. to record it.       #
+    #---------------------------------------------------------------------------------------------#
+    def read(self, run_flag, on_raw=None):
+        # NOTE: This must be set before importing ruuvitag_sensor.
+        os.environ["RUUVI_BLE_ADAPTER"] = "bluez"
+
+        # The raw advertisements are read from the adapter itself, so the unwanted ones
+        # are skipped before they are decoded and the scan can be recorded
+        from ruuvitag_sensor.ruuvi import ble
+
+        blacklist = []
+        advertisements = ble.get_data(blacklist, self.bt_device)
+
+        try:
+            for mac_address, raw in advertisements:
+                if not run_flag.running:
+                    break
+
+                if on_raw is not None:
+                    on_raw(mac_address, raw)
+
+                data_format, data = split_advertisement(raw)
+                if data is None:
+                    # Not a Ruuvi sensor
+                    if mac_address:
+                        blacklist.append(mac_address)
+                    continue
+
+                # Skip the advertisements without measurements and the unwanted ones
+                if data_format is None or (self.wants is not None and not self.wants(mac_address, data_format)):
+                    continue
+
+                sensor_data = decode_advertisement(data_format, data)
+                if sensor_data is not None:
+                    yield mac_address, sensor_data, raw
+        finally:
+            advertisements.close()
+
+#-------------------------------------------------------------------------------------------------#
+#                                          ReplayReader                                           #
+#-------------------------------------------------------------------------------------------------#
+class ReplayReader(SensorReader):
+    """
+    Plays back a capture file written by RuuviReader.
+
+    Each line is "<UNIX time> <MAC address> <raw advertisement in hex>". The original
+    timing is kept at speed 1, speed 10 plays ten times faster and speed 0 plays as
+    fast as possible. With repeat the file starts over at the end, otherwise the reader
+    stays idle until it is stopped. Lines that can't be parsed are counted and skipped.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, path: str, speed: float = 1, repeat: bool = False) -> None:
+        self.path = path
+        self.speed = speed
+        self.repeat = repeat
+        self.played = 0
+        self.skipped = 0        # Malformed lines
+
+    #---------------------------------------------------------------------------------------------#
+    # run - Plays the file until stopped                                                          #
+    #---------------------------------------------------------------------------------------------#
+    def run(self, callback, run_flag) -> None:
+        while run_flag.running:
+            self._play(callback, run_flag)
+
+            if not self.repeat:
+                break
+
+        # Stay idle, so the BLE source doesn't start the file over
+        while run_flag.running:
+            time.sleep(0.1)
+
+    #---------------------------------------------------------------------------------------------#
+    # _play - Plays the file once                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def _play(self, callback, run_flag) -> None:
+        first_timestamp = None
+        started = time.monotonic()
+
+        with open(self.path, "r") as capture:
+            for line in capture:
+                if not run_flag.running:
+                    return
+
+                fields = line.split()
+                if not fields or fields[0].startswith("#"):
+                    continue
+
+                # Is the line malformed?
+                try:
+                    timestamp, mac_address, raw = float(fields[0]), fields[1], fields[2]
+                    data_format, data = split_advertisement(raw)
+                    if len(fields) != 3:
+                        raise ValueError
+                except (ValueError, TypeError, IndexError):
+                    # Yes...
+                    self.skipped += 1
+                    continue
+
+                # Keep the original timing, scaled by the speed
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                if self.speed > 0:
+                    delay = (timestamp - first_timestamp) / self.speed - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+
+                if data_format is None or (self.wants is not None and not self.wants(mac_address, data_format)):
+                    continue
+
+                try:
+                    sensor_data = decode_advertisement(data_format, data)
+                except (ValueError, TypeError, IndexError):
+                    self.skipped += 1
+                    continue
+
+                if sensor_data is not None:
+                    callback((mac_address, sensor_data))
+                    self.played += 1
+
+#-------------------------------------------------------------------------------------------------#
+#                                         SyntheticReader                                         #
+#-------------------------------------------------------------------------------------------------#
+class SyntheticReader(SensorReader):
+    """
+    Generates data format 5 readings for `tags` made-up sensors, each advertising
+    `rate` times per second. Rate 0 generates readings as fast as possible. The values
+    wander slowly, and a fixed seed gives the same readings every run.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, tags: int = 10, rate: float = 1, seed: int = 0) -> None:
+        self.tags = max(1, tags)
+        self.rate = rate
+        self.random = random.Random(seed)
+        self.generated = 0
+
+        self.mac_addresses = [synthetic_mac(i) for i in range(self.tags)]
+        self.sequence = [0] * self.tags
+        self.temperature = [20 + self.random.uniform(-5, 5) for _ in range(self.tags)]
+        self.humidity = [40 + self.random.uniform(-10, 10) for _ in range(self.tags)]
+        self.pressure = [1013 + self.random.uniform(-10, 10) for _ in range(self.tags)]
+
+    #---------------------------------------------------------------------------------------------#
+    # run - Generates readings until stopped                                                      #
+    #---------------------------------------------------------------------------------------------#
+    def run(self, callback, run_flag) -> None:
+        interval = 1 / (self.rate * self.tags) if self.rate > 0 else 0
+        next_time = time.monotonic()
+        tag = 0
+
+        while run_flag.running:
+            if interval:
+                # Sleep only when ahead of schedule, so high rates keep up
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_time += interval
+
+            callback((self.mac_addresses[tag], self.reading(tag)))
+            self.generated += 1
+            tag = (tag + 1) % self.tags
+
+    #---------------------------------------------------------------------------------------------#
+    # reading - Next reading of a tag                                                             #
+    #---------------------------------------------------------------------------------------------#
+    def reading(self, tag: int) -> dict:
+        self.sequence[tag] = (self.sequence[tag] + 1) % 65535
+        self.temperature[tag] += self.random.gauss(0, 0.05)
+        self.humidity[tag] = min(100, max(0, self.humidity[tag] + self.random.gauss(0, 0.1)))
+        self.pressure[tag] += self.random.gauss(0, 0.02)
+
+        acceleration_z = 1000 + self.random.randint(-8, 8)
+
+        return {
+            'data_format': 5,
+            'humidity': round(self.humidity[tag], 2),
+            'temperature': round(self.temperature[tag], 2),
+            'pressure': round(self.pressure[tag], 2),
+            'acceleration': float(acceleration_z),
+            'acceleration_x': 0,
+            'acceleration_y': 0,
+            'acceleration_z': acceleration_z,
+            'tx_power': 4,
+            'battery': 3000 - self.sequence[tag] % 100,
+            'movement_counter': 0,
+            'measurement_sequence_number': self.sequence[tag],
+            'mac': self.mac_addresses[tag].replace(":", "").lower(),
+            'rssi': -40 - tag % 50,
+        }
+
+#-------------------------------------------------------------------------------------------------#
+# synthetic_mac - MAC address of a synthetic tag                                                  #
+#-------------------------------------------------------------------------------------------------#
+def synthetic_mac(index: int) -> str:
+    return "F0:00:00:{:02X}:{:02X}:{:02X}".format((index >> 16) & 0xFF, (index >> 8) & 0xFF, index & 0xFF)
+
+#-------------------------------------------------------------------------------------------------#
+# make_reader - Returns the reader chosen with the command line options and the settings          #
+#-------------------------------------------------------------------------------------------------#
+def make_reader(args, settings: dict) -> SensorReader:
+    if args.replay:
+        return ReplayReader(args.replay, speed=args.replay_speed, repeat=args.replay_repeat)
+    if args.synthetic:
+        return SyntheticReader(tags=args.synthetic, rate=args.synthetic_rate)
+
+    adapters = settings.get('ble_adapters') or []
+
+    # More than one adapter?
+    if len(adapters) > 1:
+        # Yes...
+        from broadcasting.multi_adapter_reader import MultiAdapterReader
+        return MultiAdapterReader(adapters, record_path=args.record)
+
+    # No...
+    return RuuviReader(record_path=args.record, bt_device=adapters[0] if adapters else "")
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+from constants import *
+from cloud.resilience import CircuitBreaker, AUTH, PERMANENT, ERROR_KINDS, classify_error
+
+#-------------------------------------------------------------------------------------------------#
+#                                              Spool                                              #
+#-------------------------------------------------------------------------------------------------#
+class Spool:
+    """
+    Durable on-disk buffer for readings waiting to be uploaded.
+
+    Readings are stored in an SQLite database in WAL mode. Every reading gets its push
+    key when it is spooled, so replaying a reading after a crash writes to the same
+    Firebase path instead of creating a duplicate. Uploaded readings are removed with
+    commit() in a single transaction. Readings that Firebase rejects are moved to the
+    dead_letters table with reject(), so they can be inspected later.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, path: str = SPOOL_PATH, max_readings: int = SPOOL_MAX_READINGS,
+                 max_age: float = SPOOL_MAX_AGE) -> None:
+        self.path = path
+        self.max_readings = max_readings
+        self.max_age = max_age
+        self.evicted = 0
+        self.rejected = 0
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "timestamp REAL NOT NULL, "
+            "mac_address TEXT NOT NULL, "
+            "push_key TEXT NOT NULL, "
+            "data TEXT NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letters ("
+            "id INTEGER PRIMARY KEY, "
+            "timestamp REAL NOT NULL, "
+            "mac_address TEXT NOT NULL, "
+            "push_key TEXT NOT NULL, "
+            "data TEXT NOT NULL, "
+            "rejected REAL NOT NULL)"
+        )
+
+    #---------------------------------------------------------------------------------------------#
+    # append - Stores readings. Each reading is a (mac_address, push_key, timestamp, data) tuple  #
+    #---------------------------------------------------------------------------------------------#
+    def append(self, readings: list) -> None:
+        rows = [
+            (timestamp, mac_address, push_key, json.dumps(data, separators=(",", ":")))
+            for mac_address, push_key, timestamp, data in readings
+        ]
+
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(
+                    "INSERT INTO readings (timestamp, mac_address, push_key, data) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._evict()
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    #---------------------------------------------------------------------------------------------#
+    # peek - Returns the oldest readings as (id, mac_address, push_key, data) tuples. data is the #
+    #        JSON text stored by append(), so it is uploaded without serializing it again.        #
+    #---------------------------------------------------------------------------------------------#
+    def peek(self, limit: int) -> list:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, mac_address, push_key, data FROM readings ORDER BY id LIMIT ?",
+                (limit,)
+            ).fetchall()
+
+        return rows
+
+    #---------------------------------------------------------------------------------------------#
+    # commit - Removes every reading up to and including last_id                                  #
+    #---------------------------------------------------------------------------------------------#
+    def commit(self, last_id: int) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM readings WHERE id <= ?", (last_id,))
+
+    #---------------------------------------------------------------------------------------------#
+    # reject - Moves every reading up to and including last_id to the dead letters                #
+    #---------------------------------------------------------------------------------------------#
+    def reject(self, last_id: int) -> None:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._connection.execute(
+                    "INSERT OR REPLACE INTO dead_letters (id, timestamp, mac_address, push_key, data, rejected) "
+                    "SELECT id, timestamp, mac_address, push_key, data, ? FROM readings WHERE id <= ?",
+                    (time.time(), last_id)
+                )
+                self.rejected += max(cursor.rowcount, 0)
+                self._connection.execute("DELETE FROM readings WHERE id <= ?", (last_id,))
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    #---------------------------------------------------------------------------------------------#
+    # pending - Number of readings in the spool                                                   #
+    #---------------------------------------------------------------------------------------------#
+    def pending(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+    #---------------------------------------------------------------------------------------------#
+    # close - Closes the database                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    #---------------------------------------------------------------------------------------------#
+    # _evict - Removes readings that are too old or don't fit in the spool. Caller holds the lock #
+    #---------------------------------------------------------------------------------------------#
+    def _evict(self) -> None:
+        if self.max_age:
+            cursor = self._connection.execute(
+                "DELETE FROM readings WHERE timestamp < ?", (time.time() - self.max_age,)
+            )
+            self.evicted += max(cursor.rowcount, 0)
+
+        if self.max_readings:
+            cursor = self._connection.execute(
+                "DELETE FROM readings WHERE id <= "
+                "(SELECT MAX(id) FROM readings) - ?", (self.max_readings,)
+            )
+            self.evicted += max(cursor.rowcount, 0)
+
+#-------------------------------------------------------------------------------------------------#
+#                                           SpoolDrainer                                          #
+#-------------------------------------------------------------------------------------------------#
+class SpoolDrainer:
+    """
+    Replays the spool to Firebase in order and in batches.
+
+    The drainer is a task in the asyncio loop and the spool is read and written in
+    worker threads. When an upload fails the readings stay in the spool, so nothing is
+    lost while the network is down. The circuit breaker decides when the upload is
+    tried again, and while Firebase is down no requests are sent at all. When the ID
+    token is rejected, on_auth_error is awaited before the retry, e.g. to refresh it.
+    A batch that Firebase rejects for good is moved to the dead letters, so it doesn't
+    block the newer readings.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, spool: Spool, upload, batch_size: int = UPLOAD_BATCH_SIZE,
+                 breaker: CircuitBreaker | None = None, on_auth_error=None) -> None:
+        self.spool = spool
+        self.upload = upload
+        self.batch_size = max(1, batch_size)
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.on_auth_error = on_auth_error
+
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        # Counters
+        self.uploaded = 0
+        self.failed = 0
+        self.errors = dict.fromkeys(ERROR_KINDS, 0)    # Failed uploads per error kind
+
+    #---------------------------------------------------------------------------------------------#
+    # start - Starts the drain task                                                               #
+    #---------------------------------------------------------------------------------------------#
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._drain())
+
+    #---------------------------------------------------------------------------------------------#
+    # stop - Stops the drain task. Readings that are not uploaded stay in the spool.              #
+    #---------------------------------------------------------------------------------------------#
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    #---------------------------------------------------------------------------------------------#
+    # notify - Tells the drainer that new readings were spooled                                   #
+    #---------------------------------------------------------------------------------------------#
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    #---------------------------------------------------------------------------------------------#
+    # _drain - Drain task                                                                         #
+    #---------------------------------------------------------------------------------------------#
+    async def _drain(self) -> None:
+        while True:
+            # Wait while Firebase is down or the last failure backs off
+            delay = self.breaker.retry_in()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            self._wakeup.clear()
+            readings = await asyncio.to_thread(self.spool.peek, self.batch_size)
+
+            # Is the spool empty?
+            if not readings:
+                # Yes...
+                # Wait for new readings
+                await self._wakeup.wait()
+                continue
+
+            try:
+                await self.upload([(mac_address, push_key, data) for _, mac_address, push_key, data in readings])
+            except Exception as e:
+                kind = classify_error(e)
+                self.failed += 1
+                self.errors[kind] += 1
+                self.breaker.record_failure(kind)
+
+                # Will the same readings be rejected again?
+                if kind == PERMANENT:
+                    # Yes...
+                    # Set them aside, so the newer readings can be uploaded
+                    await asyncio.shield(asyncio.to_thread(self.spool.reject, readings[-1][0]))
+                    continue
+
+                # No...
+                # The readings stay in the spool. Try again when the breaker allows.
+
+                # Was the token rejected?
+                if kind == AUTH and self.on_auth_error is not None:
+                    # Yes...
+                    await self.on_auth_error()
+                continue
+
+            self.breaker.record_success()
+
+            # The upload is done, so the commit must not be interrupted
+            await asyncio.shield(asyncio.to_thread(self.spool.commit, readings[-1][0]))
+            self.uploaded += len(readings)
@@ -0,0 +1,196 @@
+import asyncio
+import time
+from collections import deque
+
+from constants import *
+
+# Backpressure policies
+COALESCE = "coalesce"        # A newer reading replaces a pending reading of the same MAC
+DROP_OLDEST = "drop_oldest"  # Every reading is queued, the oldest one is dropped when full
+
+#-------------------------------------------------------------------------------------------------#
+#                                           UploadQueue                                           #
+#-------------------------------------------------------------------------------------------------#
+class UploadQueue:
+    """
+    Bounded producer/consumer queue between the scanner and the upload workers.
+
+    The scanner only calls put(), which never blocks. A pool of worker tasks takes
+    readings from the queue in batches and awaits the upload coroutine for each batch.
+    A batch is closed when batch_window seconds have passed since its first reading or
+    when it holds batch_size readings. When the queue is full the oldest pending
+    reading is dropped. All methods must be called in the asyncio loop.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, upload, workers: int = UPLOAD_WORKERS, max_size: int = UPLOAD_QUEUE_SIZE,
+                 policy: str = UPLOAD_QUEUE_POLICY, batch_size: int = UPLOAD_BATCH_SIZE,
+                 batch_window: float = UPLOAD_BATCH_WINDOW) -> None:
+        if policy not in (COALESCE, DROP_OLDEST):
+            raise ValueError(f"Unknown upload queue policy: {policy}")
+
+        self.upload = upload
+        self.workers = max(1, workers)
+        self.max_size = max(1, max_size)
+        self.policy = policy
+        self.batch_size = max(1, batch_size)
+        self.batch_window = max(0, batch_window)
+
+        # Pending entries are [mac_address, sensor_data, timestamp] lists so that coalescing
+        # can replace the data in place without changing the queue order.
+        self._entries = deque()
+        self._pending = {}      # MAC -> entry (only used with COALESCE)
+        self._not_empty = asyncio.Event()
+        self._batch_lock = asyncio.Lock()   # Only one worker gathers a batch at a time
+        self._tasks = []
+        self._running = False
+
+        # Counters
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.uploaded = 0
+        self.failed = 0
+
+    #---------------------------------------------------------------------------------------------#
+    # start - Starts the upload workers                                                           #
+    #---------------------------------------------------------------------------------------------#
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+
+        for i in range(self.workers):
+            self._tasks.append(asyncio.ensure_future(self._worker()))
+
+    #---------------------------------------------------------------------------------------------#
+    # stop - Stops the upload workers after their current upload. With flush, pending readings    #
+    #        are uploaded before returning, otherwise they are discarded.                         #
+    #---------------------------------------------------------------------------------------------#
+    async def stop(self, flush: bool = False) -> None:
+        self._running = False
+        self._not_empty.set()
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        remaining = [(entry[0], entry[1], entry[2]) for entry in self._entries]
+        self._entries.clear()
+        self._pending.clear()
+
+        if flush:
+            for i in range(0, len(remaining), self.batch_size):
+                await self._upload(remaining[i:i + self.batch_size])
+
+    #---------------------------------------------------------------------------------------------#
+    # put - Adds a reading to the queue. Never blocks.                                            #
+    #---------------------------------------------------------------------------------------------#
+    def put(self, mac_address: str, sensor_data: dict, timestamp: float | None = None) -> None:
+        if timestamp is None:
+            timestamp = time.time()
+
+        # Is there already a pending reading for this sensor?
+        if self.policy == COALESCE and mac_address in self._pending:
+            # Yes...
+            # Replace it with the newer one
+            entry = self._pending[mac_address]
+            entry[1] = sensor_data
+            entry[2] = timestamp
+            self.coalesced += 1
+            return
+
+        # Is the queue full?
+        if len(self._entries) >= self.max_size:
+            # Yes...
+            # Drop the oldest reading
+            oldest = self._entries.popleft()
+            if self._pending.get(oldest[0]) is oldest:
+                del self._pending[oldest[0]]
+            self.dropped += 1
+
+        entry = [mac_address, sensor_data, timestamp]
+        self._entries.append(entry)
+        if self.policy == COALESCE:
+            self._pending[mac_address] = entry
+
+        self.enqueued += 1
+        self._not_empty.set()
+
+    #---------------------------------------------------------------------------------------------#
+    # get_batch - Takes the next batch of readings from the queue. Returns None when stopped.     #
+    #---------------------------------------------------------------------------------------------#
+    async def get_batch(self) -> list | None:
+        async with self._batch_lock:
+            # Wait for the first reading of the batch
+            while self._running and not self._entries:
+                self._not_empty.clear()
+                await self._not_empty.wait()
+
+            # Keep gathering until the batch window closes or the batch is full
+            deadline = time.monotonic() + self.batch_window
+            while self._running and len(self._entries) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                self._not_empty.clear()
+                try:
+                    await asyncio.wait_for(self._not_empty.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            if not self._running:
+                return None
+
+            batch = []
+            while self._entries and len(batch) < self.batch_size:
+                entry = self._entries.popleft()
+                if self._pending.get(entry[0]) is entry:
+                    del self._pending[entry[0]]
+                batch.append((entry[0], entry[1], entry[2]))
+
+            return batch
+
+    #---------------------------------------------------------------------------------------------#
+    # depth - Number of readings waiting for upload                                               #
+    #---------------------------------------------------------------------------------------------#
+    def depth(self) -> int:
+        return len(self._entries)
+
+    #---------------------------------------------------------------------------------------------#
+    # stats - Returns a snapshot of the queue counters                                            #
+    #---------------------------------------------------------------------------------------------#
+    def stats(self) -> dict:
+        return {
+            'depth': len(self._entries),
+            'enqueued': self.enqueued,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'uploaded': self.uploaded,
+            'failed': self.failed,
+        }
+
+    #---------------------------------------------------------------------------------------------#
+    # _worker - Upload worker task                                                                #
+    #---------------------------------------------------------------------------------------------#
+    async def _worker(self) -> None:
+        while True:
+            batch = await self.get_batch()
+            if batch is None:
+                return
+
+            await self._upload(batch)
+
+    #---------------------------------------------------------------------------------------------#
+    # _upload - Uploads one batch and counts the result                                           #
+    #---------------------------------------------------------------------------------------------#
+    async def _upload(self, batch: list) -> None:
+        try:
+            await self.upload(batch)
+        except Exception:
+            self.failed += len(batch)
+        else:
+            self.uploaded += len(batch)
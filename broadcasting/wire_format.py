@@ -0,0 +1,127 @@
+import functools
+import time
+
+from constants import *
+from broadcasting.aggregator import AGGREGATE_FIELDS, AGGREGATE_KEYS
+
+# Wire formats of the uploaded readings
+FULL = "full"           # Long keys, floats and an ISO 8601 timestamp
+COMPACT = "compact"     # Short keys, fixed-point integers and a UNIX timestamp
+
+# Compact schema: full key -> (short key, scale). A value is stored as round(value * scale).
+COMPACT_FIELDS = {
+    'temperature': ("T", 1000),     # m°C
+    'humidity': ("H", 1000),        # m%
+    'pressure': ("P", 100),         # Pa
+    'rssi': ("r", 1),               # dBm
+    'battery': ("b", 1),            # mV
+}
+
+# Statistics of an aggregated reading: full key suffix -> short key suffix
+COMPACT_STATS = {"_min": "n", "_max": "x", "_stddev": "s"}
+
+#-------------------------------------------------------------------------------------------------#
+# encoder - Returns the function that turns a reading into the values uploaded in a wire format.  #
+#           Raises ValueError if the wire format is unknown.                                      #
+#-------------------------------------------------------------------------------------------------#
+def encoder(wire_format: str = WIRE_FORMAT):
+    if wire_format == FULL:
+        return encode_full
+    if wire_format == COMPACT:
+        return encode_compact
+
+    raise ValueError(f"Unknown wire format: {wire_format}")
+
+#-------------------------------------------------------------------------------------------------#
+# encode_full - Returns the values of a reading with long keys                                    #
+#-------------------------------------------------------------------------------------------------#
+def encode_full(sensor_data: dict, timestamp: float) -> dict:
+    values = {
+        'utc_timestamp': utc_timestamp(int(timestamp)),
+        'temperature': sensor_data['temperature'],
+        'humidity': sensor_data['humidity'],
+        'pressure': sensor_data['pressure'],
+        'rssi': sensor_data['rssi'],
+        'battery': sensor_data['battery'],
+    }
+
+    # Aggregated readings carry the statistics of their window
+    for key in AGGREGATE_KEYS:
+        if key in sensor_data:
+            values[key] = sensor_data[key]
+
+    return values
+
+#-------------------------------------------------------------------------------------------------#
+# encode_compact - Returns the values of a reading in the compact schema                          #
+#-------------------------------------------------------------------------------------------------#
+def encode_compact(sensor_data: dict, timestamp: float) -> dict:
+    """
+    {"v": 1, "t": 1760781234, "T": 21375, "H": 45120, "P": 101325, "r": -60, "b": 2950}
+
+    v is the schema version and t the UNIX time in seconds. The measurements are
+    integers in the units of COMPACT_FIELDS. An aggregated reading adds the number of
+    samples as "c" and the statistics as the short key with "n" (min), "x" (max) or
+    "s" (stddev), e.g. "Tn". A missing value is left out.
+    """
+    values = {'v': COMPACT_SCHEMA_VERSION, 't': int(timestamp)}
+
+    for field, (short_key, scale) in COMPACT_FIELDS.items():
+        value = sensor_data.get(field)
+        if value is not None:
+            values[short_key] = round(value * scale)
+
+    # Aggregated readings carry the statistics of their window
+    if 'samples' in sensor_data:
+        values['c'] = sensor_data['samples']
+        for field in AGGREGATE_FIELDS:
+            short_key, scale = COMPACT_FIELDS[field]
+            for suffix, short_suffix in COMPACT_STATS.items():
+                value = sensor_data.get(field + suffix)
+                if value is not None:
+                    values[short_key + short_suffix] = round(value * scale)
+
+    return values
+
+#-------------------------------------------------------------------------------------------------#
+# decode_values - Returns uploaded values in the full format, whichever format they were sent in. #
+#                 For the consumers of the database. Raises ValueError if the compact schema      #
+#                 version is unknown.                                                             #
+#-------------------------------------------------------------------------------------------------#
+def decode_values(values: dict) -> dict:
+    # Is it the full format?
+    if 'v' not in values:
+        # Yes...
+        return dict(values)
+
+    # No...
+    if values['v'] != COMPACT_SCHEMA_VERSION:
+        raise ValueError(f"Unknown compact schema version: {values['v']}")
+
+    decoded = {'utc_timestamp': utc_timestamp(values['t'])}
+
+    for field, (short_key, scale) in COMPACT_FIELDS.items():
+        decoded[field] = _unscale(values.get(short_key), scale)
+
+    if 'c' in values:
+        decoded['samples'] = values['c']
+        for field in AGGREGATE_FIELDS:
+            short_key, scale = COMPACT_FIELDS[field]
+            for suffix, short_suffix in COMPACT_STATS.items():
+                if short_key + short_suffix in values:
+                    decoded[field + suffix] = _unscale(values[short_key + short_suffix], scale)
+
+    return decoded
+
+#-------------------------------------------------------------------------------------------------#
+# utc_timestamp - Returns a UNIX time in seconds as ISO 8601 UTC text. The readings of one second #
+#                 share the text.                                                                 #
+#-------------------------------------------------------------------------------------------------#
+@functools.lru_cache(maxsize=64)
+def utc_timestamp(second: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(second))
+
+def _unscale(value, scale: int):
+    if value is None:
+        return None
+    return value if scale == 1 else value / scale
@@ -51,7 +51,17 @@ class SensorButton(urwid.Button):
     #---------------------------------------------------------------------------------------------# 
     def toggle(self, button, caption):
         # Toggle selection state
-        self.selected = not self.selected
+        self.set_selected(not self.selected)
+
+        # Call external callback if provided
+        if self.callback:
+            self.callback(self, caption)
+
+    #---------------------------------------------------------------------------------------------#
+    # set_selected - Changes the selection state without calling the callback                     #
+    #---------------------------------------------------------------------------------------------# 
+    def set_selected(self, selected: bool) -> None:
+        self.selected = selected
 
         if self.selected:
             self.attr_map.set_attr_map({None: "sensor_selected"})
@@ -62,8 +72,4 @@ class SensorButton(urwid.Button):
             self.attr_map.set_attr_map({None: "button"})
             self.attr_map.set_focus_map({
                 None: "button_focused"
-            })
-
-        # Call external callback if provided
-        if self.callback:
-            self.callback(self, caption)
\ No newline at end of file
+            })
\ No newline at end of file
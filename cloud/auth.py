@@ -0,0 +1,56 @@
+import json
+
+from pyrebase.pyrebase import Auth, raise_detailed_error
+
+from constants import *
+
+#-------------------------------------------------------------------------------------------------#
+#                                           SessionAuth                                           #
+#-------------------------------------------------------------------------------------------------#
+class SessionAuth(Auth):
+    """
+    pyrebase Auth that sends the login and token refresh requests through the shared
+    session. pyrebase itself uses a new connection for every authentication request.
+
+    auth_url replaces the Google hosts of both endpoints, e.g. to log in to the local
+    stand-in server in tools/fake_firebase.py. None uses the real Firebase Authentication.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, api_key, requests, credentials, auth_url: str | None = None) -> None:
+        super().__init__(api_key, requests, credentials)
+
+        auth_url = auth_url.rstrip("/") if auth_url else None
+        self.sign_in_url = auth_url or AUTH_SIGN_IN_URL
+        self.refresh_url = auth_url or AUTH_REFRESH_URL
+
+    #---------------------------------------------------------------------------------------------#
+    # sign_in_with_email_and_password - Logs in the user                                          #
+    #---------------------------------------------------------------------------------------------#
+    def sign_in_with_email_and_password(self, email, password):
+        request_ref = "{0}/identitytoolkit/v3/relyingparty/verifyPassword?key={1}".format(self.sign_in_url, self.api_key)
+        headers = {"content-type": "application/json; charset=UTF-8"}
+        data = json.dumps({"email": email, "password": password, "returnSecureToken": True})
+        request_object = self.requests.post(request_ref, headers=headers, data=data)
+        raise_detailed_error(request_object)
+        self.current_user = request_object.json()
+        return self.current_user
+
+    #---------------------------------------------------------------------------------------------#
+    # refresh - Exchanges the refresh token for a new ID token                                    #
+    #---------------------------------------------------------------------------------------------#
+    def refresh(self, refresh_token):
+        request_ref = "{0}/v1/token?key={1}".format(self.refresh_url, self.api_key)
+        headers = {"content-type": "application/json; charset=UTF-8"}
+        data = json.dumps({"grantType": "refresh_token", "refreshToken": refresh_token})
+        request_object = self.requests.post(request_ref, headers=headers, data=data)
+        raise_detailed_error(request_object)
+        request_object_json = request_object.json()
+        return {
+            "userId": request_object_json["user_id"],
+            "idToken": request_object_json["id_token"],
+            "refreshToken": request_object_json["refresh_token"],
+            "expiresIn": request_object_json["expires_in"],
+        }
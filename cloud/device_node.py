@@ -0,0 +1,80 @@
+import json
+
+from pyrebase.pyrebase import raise_detailed_error
+
+import globals
+
+#-------------------------------------------------------------------------------------------------#
+#                                           DeviceNode                                            #
+#-------------------------------------------------------------------------------------------------#
+class DeviceNode:
+    """
+    The device's node in the Realtime Database, users/<user_uid>/devices/<device_uuid>,
+    for the uploads.
+
+    The request URL is built once and again only when the user, the device UUID or
+    the ID token changes, instead of walking pyrebase's child() chain for every update.
+    The keys of every sensor are encoded once too. The readings arrive as the JSON
+    text stored in the spool, so they are serialized only once, and the history entry
+    and the new_values snapshot of a reading share the same text.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, database_url: str, requests) -> None:
+        self.database_url = database_url if database_url.endswith("/") else database_url + "/"
+        self.requests = requests
+
+        self._url = None
+        self._url_key = None    # (user_uid, device_uuid, token) of the URL
+        self._sensor_keys = {}  # MAC -> JSON-encoded key prefix of the history entries, new_values key
+
+    #---------------------------------------------------------------------------------------------#
+    # url - Returns the URL of the device node with the token                                     #
+    #---------------------------------------------------------------------------------------------#
+    def url(self, token: str) -> str:
+        url_key = (globals.settings['user_uid'], globals.settings['device_uuid'], token)
+
+        # Has anything in the URL changed?
+        if url_key != self._url_key:
+            # Yes...
+            user_uid, device_uuid, _ = url_key
+            self._url = f"{self.database_url}users/{user_uid}/devices/{device_uuid}.json?auth={token}"
+            self._url_key = url_key
+
+        return self._url
+
+    #---------------------------------------------------------------------------------------------#
+    # update - Sends readings as one multi-location update. Each reading is a (mac_address,       #
+    #          push_key, data) tuple, where data is the reading's values as JSON text.            #
+    #---------------------------------------------------------------------------------------------#
+    def update(self, readings, token: str) -> None:
+        response = self.requests.patch(
+            self.url(token),
+            headers={"content-type": "application/json; charset=UTF-8"},
+            data=self.update_body(readings),
+        )
+        raise_detailed_error(response)
+
+    #---------------------------------------------------------------------------------------------#
+    # update_body - Returns the JSON body of the update: a history entry per reading and the      #
+    #               newest reading of every sensor in new_values                                  #
+    #---------------------------------------------------------------------------------------------#
+    def update_body(self, readings) -> bytes:
+        entries = []
+        new_values = {}
+
+        for mac_address, push_key, data in readings:
+            keys = self._sensor_keys.get(mac_address)
+            if keys is None:
+                keys = (json.dumps(f"{mac_address}/")[:-1], json.dumps(f"new_values/{mac_address}"))
+                self._sensor_keys[mac_address] = keys
+
+            # Push keys use only letters, digits, "-" and "_"
+            entries.append(f'{keys[0]}{push_key}":{data}')
+            new_values[keys[1]] = data
+
+        entries.extend(f"{key}:{data}" for key, data in new_values.items())
+
+        return ("{" + ",".join(entries) + "}").encode("utf-8")
@@ -0,0 +1,83 @@
+import threading
+
+import globals
+from constants import *
+
+# Keys pyrebase needs in isolinna.json
+REQUIRED_KEYS = ("apiKey", "authDomain", "databaseURL", "storageBucket")
+
+_lock = threading.Lock()
+
+#-------------------------------------------------------------------------------------------------#
+# ensure_firebase - Sets up globals.firebase, globals.auth, globals.http_session and              #
+#                   globals.device_node from globals.firebase_config, unless they are set up      #
+#                   already                                                                       #
+#-------------------------------------------------------------------------------------------------#
+def ensure_firebase() -> None:
+    """
+    pyrebase pulls in the Google client libraries, which takes most of the start-up
+    time on a slow device. The configuration is read at start-up, but pyrebase is
+    imported and the services are made only here, on first use: at login, when
+    broadcasting starts or in the background by preload_firebase(). Safe to call
+    from any thread.
+    """
+    if globals.firebase is not None:
+        return
+
+    with _lock:
+        if globals.firebase is not None:
+            return
+
+        import pyrebase
+        from cloud.auth import SessionAuth
+        from cloud.device_node import DeviceNode
+        from cloud.http_session import FirebaseSession
+
+        firebase = pyrebase.initialize_app(globals.firebase_config)
+
+        # Every Firebase request goes through one shared keep-alive session
+        http_session = FirebaseSession(
+            pool_size=globals.settings.get('http_pool_size', HTTP_POOL_SIZE),
+            timeout=globals.settings.get('http_timeout', HTTP_TIMEOUT),
+            retries=globals.settings.get('http_retries', HTTP_RETRIES),
+            backoff=globals.settings.get('http_backoff', HTTP_BACKOFF),
+        )
+        firebase.requests = http_session
+
+        globals.metrics.counter(
+            "http_requests_total", "Requests sent to Firebase",
+            function=lambda: http_session.stats()['requests']
+        )
+        globals.metrics.counter(
+            "http_connections_total", "Connections opened to Firebase",
+            function=lambda: http_session.stats()['connections']
+        )
+
+        globals.http_session = http_session
+        globals.auth = SessionAuth(
+            firebase.api_key, http_session, firebase.credentials,
+            auth_url=globals.firebase_config.get('authURL')
+        )
+        globals.device_node = DeviceNode(firebase.database_url, http_session)
+
+        # Set last: the other threads check this one
+        globals.firebase = firebase
+
+#-------------------------------------------------------------------------------------------------#
+# preload_firebase - Runs ensure_firebase() in a background thread, so it is usually done before  #
+#                    the user logs in. A failure is raised again on first use.                    #
+#-------------------------------------------------------------------------------------------------#
+def preload_firebase() -> None:
+    def preload():
+        try:
+            ensure_firebase()
+        except Exception:
+            pass
+
+    threading.Thread(target=preload, name="firebase-preload", daemon=True).start()
+
+#-------------------------------------------------------------------------------------------------#
+# missing_keys - Returns the required keys that are missing from a Firebase configuration         #
+#-------------------------------------------------------------------------------------------------#
+def missing_keys(firebase_config: dict) -> list:
+    return [key for key in REQUIRED_KEYS if key not in firebase_config]
@@ -0,0 +1,71 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from constants import *
+
+#-------------------------------------------------------------------------------------------------#
+#                                         FirebaseSession                                         #
+#-------------------------------------------------------------------------------------------------#
+class FirebaseSession(requests.Session):
+    """
+    Shared keep-alive HTTP session for every Firebase request.
+
+    The session keeps a pool of open connections per host, so logins, token refreshes
+    and uploads reuse the TCP+TLS connection instead of doing a new handshake each time.
+    Requests get a default timeout and failed connections are retried with backoff.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, timeout: float = HTTP_TIMEOUT,
+                 retries: int = HTTP_RETRIES, backoff: float = HTTP_BACKOFF) -> None:
+        super().__init__()
+        self.timeout = timeout
+
+        # Only failed connections are retried here, because the request never reached
+        # Firebase. Error responses and timeouts go to the caller at once, so the upload
+        # circuit breaker sees every failure and decides when to try again.
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=backoff,
+            allowed_methods=frozenset(["GET", "PUT", "PATCH", "POST", "DELETE"]),
+            raise_on_status=False,   # pyrebase reports the error response
+        )
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        for scheme in ('http://', 'https://'):
+            self.mount(scheme, self.adapter)
+
+    #---------------------------------------------------------------------------------------------#
+    # request - Adds the default timeout to every request                                         #
+    #---------------------------------------------------------------------------------------------#
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+    #---------------------------------------------------------------------------------------------#
+    # stats - Returns the number of requests and new connections per host                         #
+    #---------------------------------------------------------------------------------------------#
+    def stats(self) -> dict:
+        requests_sent = 0
+        connections = 0
+        pools = self.adapter.poolmanager.pools
+
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_sent += pool.num_requests
+            connections += pool.num_connections
+
+        return {
+            'requests': requests_sent,
+            'connections': connections,
+            'reused': max(requests_sent - connections, 0),
+        }
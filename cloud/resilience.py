@@ -0,0 +1,170 @@
+import random
+import time
+
+from constants import *
+
+# Kinds of Firebase errors
+AUTH = "auth"               # 401/403: the ID token was rejected
+QUOTA = "quota"             # 429: Firebase asks to slow down
+TRANSIENT = "transient"     # Connection errors, timeouts and 5xx responses
+PERMANENT = "permanent"     # Other 4xx responses and errors that a retry won't fix by itself
+
+ERROR_KINDS = (AUTH, QUOTA, TRANSIENT, PERMANENT)
+
+# Circuit breaker states
+CLOSED = "closed"           # Firebase is healthy
+OPEN = "open"               # Firebase is down. Nothing is sent until the retry time.
+HALF_OPEN = "half_open"     # The retry time has passed. The next request tests Firebase.
+
+#-------------------------------------------------------------------------------------------------#
+#                                             Backoff                                             #
+#-------------------------------------------------------------------------------------------------#
+class Backoff:
+    """
+    Capped exponential backoff with jitter. Every failure doubles the delay, from
+    base_delay up to max_delay, and the delay is picked at random from its upper half,
+    so devices that failed together don't retry together.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY) -> None:
+        self.base_delay = base_delay
+        self.max_delay = max(base_delay, max_delay)
+        self.failures = 0
+
+    #---------------------------------------------------------------------------------------------#
+    # next_delay - Records a failure and returns the seconds to wait before the next attempt      #
+    #---------------------------------------------------------------------------------------------#
+    def next_delay(self) -> float:
+        self.failures += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** min(self.failures - 1, 32))
+        return random.uniform(delay / 2, delay)
+
+    #---------------------------------------------------------------------------------------------#
+    # reset - Records a success, so the next failure waits base_delay again                       #
+    #---------------------------------------------------------------------------------------------#
+    def reset(self) -> None:
+        self.failures = 0
+
+#-------------------------------------------------------------------------------------------------#
+#                                         CircuitBreaker                                          #
+#-------------------------------------------------------------------------------------------------#
+class CircuitBreaker:
+    """
+    Decides when requests to Firebase may be sent.
+
+    Every failure delays the next request with a backoff. failure_threshold transient
+    failures in a row, or one quota error, open the breaker: Firebase is considered
+    down and nothing is sent until the backoff has passed. Then the breaker is half
+    open and the next request tests Firebase. Its success closes the breaker, its
+    failure opens it again for a longer time. Auth and permanent errors are delayed
+    too, but don't open the breaker, because Firebase itself is working. All methods
+    must be called from the asyncio loop.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.backoff = Backoff(base_delay, max_delay)
+
+        self.state = CLOSED
+        self.retry_at = 0.0         # Monotonic time of the next allowed request
+        self.last_error = None      # Kind of the last error
+        self.opened = 0             # Times the breaker has opened
+
+        self._transient_failures = 0
+
+    #---------------------------------------------------------------------------------------------#
+    # retry_in - Returns the seconds until the next request may be sent, 0 if it may be sent now  #
+    #---------------------------------------------------------------------------------------------#
+    def retry_in(self) -> float:
+        delay = self.retry_at - time.monotonic()
+        if delay > 0:
+            return delay
+
+        if self.state == OPEN:
+            self.state = HALF_OPEN
+        return 0.0
+
+    #---------------------------------------------------------------------------------------------#
+    # record_success - Records a successful request                                               #
+    #---------------------------------------------------------------------------------------------#
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.retry_at = 0.0
+        self.last_error = None
+        self.backoff.reset()
+        self._transient_failures = 0
+
+    #---------------------------------------------------------------------------------------------#
+    # record_failure - Records a failed request of the given error kind                           #
+    #---------------------------------------------------------------------------------------------#
+    def record_failure(self, kind: str) -> None:
+        self.last_error = kind
+        self.retry_at = time.monotonic() + self.backoff.next_delay()
+
+        # Did Firebase answer?
+        if kind not in (TRANSIENT, QUOTA):
+            # Yes...
+            self._transient_failures = 0
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+            return
+
+        # No, or it asked to slow down...
+        self._transient_failures += 1
+
+        # Is Firebase down or overloaded?
+        if kind == QUOTA or self._transient_failures >= self.failure_threshold or self.state == HALF_OPEN:
+            # Yes...
+            if self.state != OPEN:
+                self.opened += 1
+            self.state = OPEN
+
+    #---------------------------------------------------------------------------------------------#
+    # status_text - Returns the state as text for the status line                                 #
+    #---------------------------------------------------------------------------------------------#
+    def status_text(self) -> str:
+        retry_in = max(0, self.retry_at - time.monotonic())
+
+        if self.state == OPEN:
+            return f"Down ({self.last_error}), retry in {retry_in:.0f} s"
+        if self.state == HALF_OPEN:
+            return "Testing"
+        if retry_in > 0:
+            return f"Error ({self.last_error}), retry in {retry_in:.0f} s"
+        return "OK"
+
+#-------------------------------------------------------------------------------------------------#
+# classify_error - Returns the kind of a Firebase error: AUTH, QUOTA, TRANSIENT or PERMANENT      #
+#-------------------------------------------------------------------------------------------------#
+def classify_error(error: BaseException) -> str:
+    # pyrebase raises a new HTTPError with the original one, which has the response, as
+    # its first argument
+    response = getattr(error, 'response', None)
+    if response is None and error.args:
+        response = getattr(error.args[0], 'response', None)
+
+    # Did Firebase answer?
+    if response is not None:
+        # Yes...
+        status = response.status_code
+        if status in (401, 403):
+            return AUTH
+        if status == 429:
+            return QUOTA
+        if status >= 500:
+            return TRANSIENT
+        return PERMANENT
+
+    # No...
+    # The requests exceptions, e.g. ConnectionError and Timeout, are OSErrors
+    if isinstance(error, OSError):
+        return TRANSIENT
+
+    return PERMANENT
@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import globals
+from constants import *
+from cloud.resilience import Backoff, classify_error
+
+#-------------------------------------------------------------------------------------------------#
+#                                          TokenManager                                           #
+#-------------------------------------------------------------------------------------------------#
+class TokenManager:
+    """
+    Keeps the user's ID token fresh in the background.
+
+    A timer task refreshes the token TOKEN_UPDATE_DURATION seconds before it expires,
+    using the lifetime returned by the server. Uploads read the current token with
+    get_token() without taking a lock. Concurrent refresh() calls share a single
+    request, and every successful refresh saves the settings once. A failed refresh is
+    retried with a backoff, and the kind of its error is kept in last_error until a
+    refresh succeeds.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, auth, backoff: Backoff | None = None) -> None:
+        self.auth = auth
+        self.backoff = backoff if backoff is not None else Backoff(RETRY_BASE_DELAY, TOKEN_RETRY_INTERVAL)
+        self.last_error = None      # Kind of the error of the last failed refresh
+
+        self.id_token = globals.settings['id_token']
+        self.expiration_time = globals.settings['token_expiration_time']
+        self.lifetime = None        # Token lifetime returned by the server
+        self.refreshes = 0
+
+        self.refresh_metric = globals.metrics.counter("token_refreshes_total", "Successful ID token refreshes")
+        self.failure_metric = globals.metrics.counter("token_refresh_failures_total", "Failed ID token refreshes")
+
+        self._refresh_task = None   # The refresh that is running, if any
+        self._task = None
+
+    #---------------------------------------------------------------------------------------------#
+    # start - Starts the refresh timer                                                            #
+    #---------------------------------------------------------------------------------------------#
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    #---------------------------------------------------------------------------------------------#
+    # stop - Stops the refresh timer                                                              #
+    #---------------------------------------------------------------------------------------------#
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    #---------------------------------------------------------------------------------------------#
+    # get_token - Returns the current ID token                                                    #
+    #---------------------------------------------------------------------------------------------#
+    def get_token(self) -> str:
+        return self.id_token
+
+    #---------------------------------------------------------------------------------------------#
+    # ensure_token - Returns a token that has not expired, refreshing it first if needed          #
+    #---------------------------------------------------------------------------------------------#
+    async def ensure_token(self) -> str:
+        # The timer normally refreshes the token well in advance. If that has failed
+        # and the token has already expired, refresh it now.
+        if time.time() >= self.expiration_time:
+            await self.refresh()
+        return self.id_token
+
+    #---------------------------------------------------------------------------------------------#
+    # refresh - Refreshes the token. Callers arriving during a refresh wait for its result.       #
+    #---------------------------------------------------------------------------------------------#
+    async def refresh(self) -> bool:
+        # Is another task already refreshing the token?
+        if self._refresh_task is None or self._refresh_task.done():
+            # No...
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+
+        # Cancelling one waiter must not cancel the refresh the others are waiting for
+        return await asyncio.shield(self._refresh_task)
+
+    #---------------------------------------------------------------------------------------------#
+    # _refresh - Sends the refresh request and stores the new tokens                              #
+    #---------------------------------------------------------------------------------------------#
+    async def _refresh(self) -> bool:
+        try:
+            tokens = await asyncio.to_thread(self.auth.refresh, globals.settings['refresh_token'])
+        except Exception as e:
+            # The user interface owns the terminal, so the error is shown in the status
+            self.failure_metric.inc()
+            self.last_error = classify_error(e)
+            return False
+
+        expiration_time = int(time.time()) + int(tokens['expiresIn'])
+
+        globals.settings['id_token'] = tokens['idToken']
+        globals.settings['refresh_token'] = tokens['refreshToken']
+        globals.settings['token_expiration_time'] = expiration_time
+
+        self.id_token = tokens['idToken']
+        self.expiration_time = expiration_time
+        self.lifetime = int(tokens['expiresIn'])
+        self.refreshes += 1
+        self.refresh_metric.inc()
+        self.last_error = None
+        self.backoff.reset()
+
+        globals.settings_store.save()
+        return True
+
+    #---------------------------------------------------------------------------------------------#
+    # _run - Timer task. Refreshes the token TOKEN_UPDATE_DURATION seconds before it expires.     #
+    #---------------------------------------------------------------------------------------------#
+    async def _run(self) -> None:
+        while True:
+            # Never refresh earlier than halfway through the token's lifetime
+            lead_time = TOKEN_UPDATE_DURATION
+            if self.lifetime is not None:
+                lead_time = min(lead_time, self.lifetime / 2)
+
+            delay = self.expiration_time - lead_time - time.time()
+
+            # Is it time to refresh?
+            if delay > 0:
+                # No...
+                await asyncio.sleep(delay)
+                continue
+
+            # Yes...
+            if not await self.refresh():
+                # Try again later
+                await asyncio.sleep(self.backoff.next_delay())
@@ -1,7 +1,13 @@
 # Global Constants
 SETTINGS_PATH = 'settings.json'
 FIREBASE_CONF_PATH = 'isolinna.json'
+SPOOL_PATH = 'spool.db'
+HISTORY_PATH = 'history'
+SETTINGS_SAVE_DELAY = 2         # Seconds to gather settings changes before writing the file
 TOKEN_UPDATE_DURATION = 1800    # 1800 seconds = 30 minutes
+TOKEN_RETRY_INTERVAL = 60       # Longest wait in seconds between the retries of a failed token refresh
+AUTH_SIGN_IN_URL = "https://www.googleapis.com"          # Host of the sign-in endpoint
+AUTH_REFRESH_URL = "https://securetoken.googleapis.com"  # Host of the token refresh endpoint
 
 LOGIN_SCREEN_WIDTH = 0
 LOGIN_SCREEN_HEIGHT = 12
@@ -18,4 +24,61 @@ TIME_INTERVAL_DIALOG_HEIGHT = 8
 UUID_DIALOG_WIDTH = 58
 UUID_DIALOG_HEIGHT = 8
 SENSORS_DIALOG_WIDTH = 60
-SENSORS_DIALOG_HEIGHT = 15
\ No newline at end of file
+SENSORS_DIALOG_HEIGHT = 16
+
+# Upload queue
+UPLOAD_WORKERS = 2              # Number of upload worker tasks
+UPLOAD_QUEUE_SIZE = 256         # Maximum number of readings waiting for upload
+UPLOAD_QUEUE_POLICY = "coalesce"    # "coalesce" = keep only the newest reading per MAC, "drop_oldest"
+UPLOAD_BATCH_WINDOW = 2         # Seconds to gather readings into one Firebase update
+UPLOAD_BATCH_SIZE = 50          # Maximum number of readings in one Firebase update
+STATUS_REFRESH_INTERVAL = 1     # Seconds between status updates in the UI
+DASHBOARD_REFRESH_INTERVAL = 1  # Seconds between sensor dashboard updates
+STATUS_LOG_INTERVAL = 60        # Seconds between status lines in the headless mode
+UI_REFRESH_RATE = 10            # Maximum screen updates per second from background threads
+
+# BLE
+BLE_QUEUE_SIZE = 1024           # Readings buffered per BLE subscriber before the oldest is dropped
+BLE_DEDUPE_WINDOW = 0.05        # Seconds to wait for copies of an advertisement from the other adapters
+BLE_DEDUPE_MEMORY = 5           # Seconds late copies of an advertisement are recognized and dropped
+BLE_ADAPTER_RESTART_DELAY = 5   # Seconds before a stopped adapter worker is started again
+BLE_RESTART_BASE_DELAY = 1      # Seconds before a failed sensor reader is started again
+BLE_RESTART_MAX_DELAY = 60      # Longest wait in seconds before a failed sensor reader is started again
+BLE_FILTER_INTERVAL = 0.5       # Seconds between the checks for changed wanted sensors in the adapter workers
+
+# Sampling policy
+SAMPLING_MAX_SILENCE = 900      # A sensor uploads at least once in this many seconds, even if nothing changes
+DEADBAND_TEMPERATURE = 0.2      # °C
+DEADBAND_HUMIDITY = 1           # %
+DEADBAND_PRESSURE = None        # hPa. None = pressure changes don't trigger an upload
+AGGREGATE_READINGS = True       # Upload the mean/min/max/stddev of the readings since the last upload
+AGGREGATE_PRECISION = 3         # Decimals in the aggregated means and standard deviations
+UPLOAD_DATA_FORMATS = (5,)      # Data formats that have every uploaded value (RAWv2)
+WIRE_FORMAT = "full"            # "full" = long keys and ISO 8601 timestamps, "compact" = short keys and integers
+COMPACT_SCHEMA_VERSION = 1      # Version in every reading uploaded in the compact wire format
+
+# Offline spool
+SPOOL_MAX_READINGS = 100000     # Oldest readings are evicted when the spool grows larger
+SPOOL_MAX_AGE = 604800          # 604800 seconds = 7 days
+
+# Local history
+HISTORY_INDEX_STRIDE = 64       # Every 64th record is added to the sparse time index
+HISTORY_MAX_DAYS = 90           # Days of history kept on disk
+HISTORY_FLUSH_INTERVAL = 10     # Seconds readings may stay buffered in memory
+HISTORY_MAX_OPEN_WRITERS = 128  # Sensors whose history files are kept open, two files each
+
+# Metrics
+METRICS_PREFIX = "isolinna_"    # Prefix of every metric name
+METRICS_HOST = "127.0.0.1"      # The metrics endpoint only listens locally
+METRICS_DUMP_INTERVAL = 60      # Seconds between metrics snapshots written to metrics_file
+
+# HTTP session
+HTTP_POOL_SIZE = 4              # Keep-alive connections per host
+HTTP_TIMEOUT = 10               # Seconds before a request times out
+HTTP_RETRIES = 3                # Retries for failed connections
+HTTP_BACKOFF = 0.5              # Retry backoff factor in seconds
+
+# Firebase resilience
+RETRY_BASE_DELAY = 1            # Seconds before the first retry of a failed Firebase request
+RETRY_MAX_DELAY = 300           # Every failure doubles the wait, up to this many seconds
+CIRCUIT_FAILURE_THRESHOLD = 3   # Connection and server errors in a row that mark Firebase as down
\ No newline at end of file
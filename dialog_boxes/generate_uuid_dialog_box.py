@@ -1,6 +1,5 @@
 import urwid
 import uuid
-import json
 
 import globals
 from constants import *
@@ -68,12 +67,7 @@ class GenerateUuidDialogBox:
             self.owner.main_screen.refresh_info()
             
         # Save settings...
-        try:
-            with open(SETTINGS_PATH, 'w') as f:
-                json.dump(globals.settings, f, indent=4)
-        except IOError:
-            print(f"{SETTINGS_PATH}: Could not write file. Please check if you have write permissions.")
-            exit(1)
+        globals.settings_store.save()
 
         # Go back
         self.back()
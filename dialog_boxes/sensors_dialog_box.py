@@ -1,17 +1,14 @@
-import os
+import time
 import urwid
-import json
-import threading
-
-# NOTE: This must be set before importing ruuvitag_sensor.
-os.environ["RUUVI_BLE_ADAPTER"] = "bluez"
-
-from ruuvitag_sensor.ruuvi import RuuviTagSensor, RunFlag
 
 import globals
 from constants import *
 from buttons.custom_button import CustomButton
 from buttons.sensor_button import SensorButton
+from widgets.sensor_list_walker import SensorListWalker, SORT_NONE, SORT_RSSI, SORT_LAST_SEEN
+
+# Sort orders in the order the sort button goes through them
+SORT_ORDERS = [(SORT_NONE, "Sort: found"), (SORT_RSSI, "Sort: RSSI"), (SORT_LAST_SEEN, "Sort: last seen")]
 
 #-------------------------------------------------------------------------------------------------#
 #                                          SensorsDialog                                          #
@@ -23,17 +20,15 @@ class SensorsDialogBox:
     def __init__(self, owner, selected_sensors=[], restore_from_settings=True):
         self.owner = owner
 
+        # The selected sensors are kept in a dict, which is an ordered set with O(1) lookups
         if restore_from_settings and globals.settings['followed_sensors']:
             # Restore selection from settings file
-            self.selected_sensors = globals.settings['followed_sensors'].copy()
+            self.selected_sensors = dict.fromkeys(globals.sensors.followed())
         else:
             # Use provided lists
-            self.selected_sensors = selected_sensors.copy() if selected_sensors else []
+            self.selected_sensors = dict.fromkeys(selected_sensors)
 
-        sensors_menu_items = []
         self.automatic_button = None
-        globals.run_flag = RunFlag()
-        globals.run_flag.running = False
 
         scan_button = CustomButton("Scan", self.scan)
         save_button = CustomButton("Save", self.save_sensors)
@@ -55,30 +50,16 @@ class SensorsDialogBox:
         else:
             self.automatic_button = SensorButton("Automatic", callback=self.automatic, selected=False)
 
-        sensors_menu_items.append(self.automatic_button)
-
-        # Add sensors from discovered sensors
-        for i, sensor in enumerate(globals.discovered_sensors):
-            if sensor in self.selected_sensors:
-                sensors_menu_items.append(
-                    SensorButton(
-                        sensor,
-                        callback=lambda btn, cap, idx=i: self.select_sensor(btn, idx),
-                        selected=True
-                    )
-                )
-            else:
-                sensors_menu_items.append(
-                    SensorButton(
-                        sensor,
-                        callback=lambda btn, cap, idx=i: self.select_sensor(btn, idx),
-                        selected=False
-                    )
-                )
+        # Sensors from the sensor registry. The rows are built when they are shown.
+        self.walker = SensorListWalker(
+            globals.sensors,
+            self.selected_sensors,
+            self.select_sensor,
+            fixed=[self.automatic_button]
+        )
 
         # Set up the sensors menu
-        body = [*sensors_menu_items]
-        listbox = urwid.ListBox(urwid.SimpleFocusListWalker(body))
+        listbox = urwid.ListBox(self.walker)
         padded = urwid.Padding(listbox, left=1, right=1)
         sensors_menu = urwid.LineBox(
             padded,
@@ -92,7 +73,19 @@ class SensorsDialogBox:
 
         sensors_menu = urwid.BoxAdapter(sensors_menu, SENSORS_MENU_HEIGHT)
 
-        self.main_pile = urwid.Pile([sensors_menu, buttons])
+        # Filter and sort
+        self.filter_edit = urwid.Edit("Filter: ", "", wrap=urwid.CLIP)
+        urwid.connect_signal(self.filter_edit, "postchange", lambda *_: self.walker.set_filter(self.filter_edit.edit_text))
+
+        self.sort_index = 0
+        self.sort_button = urwid.Button(SORT_ORDERS[0][1], on_press=self.change_sort)
+
+        tools = urwid.Columns([
+            urwid.AttrMap(self.filter_edit, "edit_caption", "focus_edit_caption"),
+            (19, urwid.AttrMap(self.sort_button, "button", "button_focused")),
+        ], dividechars=1)
+
+        self.main_pile = urwid.Pile([tools, sensors_menu, buttons])
         padded_pile = urwid.Padding(self.main_pile, left=1, right=1)
         filler = urwid.Filler(padded_pile, valign="top")
 
@@ -114,7 +107,7 @@ class SensorsDialogBox:
     #---------------------------------------------------------------------------------------------#    
     def back(self, *_args) -> None:
         # This is not important... It is for the UI. selected_sensors has to be initialize to it's original state. 
-        self.selected_sensors = globals.settings['followed_sensors'].copy()
+        self.selected_sensors = dict.fromkeys(globals.sensors.followed())
 
         if self.owner.top and self.owner.top.box_level > 1:
             self.owner.top.original_widget = self.owner.top.original_widget[0]
@@ -124,52 +117,55 @@ class SensorsDialogBox:
     # scan - Scans for Ruuvi Tag - sensors                                                        #
     #---------------------------------------------------------------------------------------------#
     def scan(self, *_args) -> None:
-        new_found_sensors = []
+        new_found_sensors = {}
+        scan_started = time.time()
 
         #---------------------------------------------------------------------#
         # on_ok_clicked -                                                     #
         #---------------------------------------------------------------------#
         def on_ok_clicked(button):
-            globals.run_flag.running = False  # Stop scanning
+            subscription.close()  # Stop scanning
 
-            # Remove the current overlay / SensorDialog
-            if self.owner.top and self.owner.top.box_level > 0:
-                self.owner.top.original_widget = self.owner.top.original_widget[0]
-                self.owner.top.box_level -= 1
+            # The found sensors are already in the list, so the dialog stays as it is
+            globals.loop.widget = original_widget
 
-            # Reopen the sensors dialog with updated sensor list
-            SensorsDialogBox(self.owner, self.selected_sensors, restore_from_settings=False)
+            # Sorted lists change with the readings, so sort once more
+            self.walker.refresh()
 
-            globals.loop.widget = original_widget
+        #---------------------------------------------------------------------#
+        # update_texts - Shows the found sensors. Runs in the main loop.      #
+        #---------------------------------------------------------------------#
+        def update_texts():
+            count_text.set_text(('info', f" Found {found_sensors} new sensors:\n"))
+            sensors_text.set_text(('body', "\n".join(new_found_sensors)))
 
         #---------------------------------------------------------------------#
-        # scan_sensors - Callback function for the Ruuvi get_data             #
+        # scan_sensors - Handles a reading from the scan                      #
         #---------------------------------------------------------------------#
         def scan_sensors(found_data):
             nonlocal found_sensors
             mac_address, sensor_data = found_data
+            record = globals.sensors.get(mac_address)
 
-            if mac_address not in globals.discovered_sensors:
-                globals.discovered_sensors.append(mac_address)
-                new_found_sensors.append(mac_address)
+            # The BLE source has already added the sensor to the registry, so a sensor is
+            # new if it was seen for the first time during this scan.
+            if record.first_seen >= scan_started and mac_address not in new_found_sensors:
+                new_found_sensors[mac_address] = None
                 found_sensors += 1
+                self.walker.add(mac_address)
                 
-                count_text.set_text(('info', f" Found {found_sensors} new sensors:\n"))
-                # sensors_text.set_text(('body', "\n".join(globals.discovered_sensors)))
-                sensors_text.set_text(('body', "\n".join(new_found_sensors)))
-                globals.loop.draw_screen()  # Force redraw
+                # The bridge limits how often the screen is redrawn
+                globals.ui_bridge.post("scan", update_texts)
 
         #---------------------------------------------------------------------#
-        # scan_sensors_thread - Thread for scanning Ruuvi-sensors             #
+        # scan_sensors_task - Task for scanning Ruuvi-sensors                 #
         #---------------------------------------------------------------------#
-        def scan_sensors_thread():
-            RuuviTagSensor.get_data(scan_sensors, None, globals.run_flag)
+        async def scan_sensors_task():
+            async for found_data in subscription:
+                scan_sensors(found_data)
             
         #----------------------------------------------------------------------
 
-        # Set the RunFlag to True
-        globals.run_flag.running = True
-
         # Save the current widget so we can restore it
         original_widget = globals.loop.widget
         found_sensors = 0
@@ -204,23 +200,19 @@ class SensorsDialogBox:
 
         globals.loop.widget = overlay
 
-        # Create a thread for scanning Ruuvi-sensors
-        thread = threading.Thread(target=scan_sensors_thread, daemon=True)
-        thread.start()
+        # Scan with an own subscription, so broadcasting can continue at the same time
+        subscription = globals.ble_source.subscribe()
+        globals.aio_loop.create_task(scan_sensors_task())
 
     #---------------------------------------------------------------------------------------------#
     # save_sensors - Save selected sensors and goes back to the Main Screen                       #
     #---------------------------------------------------------------------------------------------#
     def save_sensors(self, button: urwid.Button):
-        globals.settings['followed_sensors'] = self.selected_sensors
+        globals.settings['followed_sensors'] = list(self.selected_sensors)
+        globals.sensors.set_followed(self.selected_sensors)
         
         # Save settings
-        try:
-            with open(SETTINGS_PATH, 'w') as f:
-                json.dump(globals.settings, f, indent=4)
-        except IOError:
-            print(f"{SETTINGS_PATH}: Could not write file. Please check if you have write permissions.")
-            exit(1)
+        globals.settings_store.save()
 
         # Go back
         self.back()    
@@ -229,29 +221,32 @@ class SensorsDialogBox:
     # automatic - When Automatic is selected                                                      #
     #---------------------------------------------------------------------------------------------#
     def automatic(self, *_args):
-        self.selected_sensors = []
+        # The walker shares the dict, so it is cleared in place
+        self.selected_sensors.clear()
 
-        # Close current dialog...
-        if self.owner.top and self.owner.top.box_level > 1:
-            self.owner.top.original_widget = self.owner.top.original_widget[0]
-            self.owner.top.box_level -= 1
+        # Update the buttons in place
+        self.automatic_button.set_selected(True)
+        self.walker.update_selection()
 
-        # Reopen WITHOUT restoring settings
-        SensorsDialogBox(self.owner, self.selected_sensors, restore_from_settings=False)
+    #---------------------------------------------------------------------------------------------#
+    # change_sort - Goes to the next sort order                                                   #
+    #---------------------------------------------------------------------------------------------#
+    def change_sort(self, *_args):
+        self.sort_index = (self.sort_index + 1) % len(SORT_ORDERS)
+        sort, label = SORT_ORDERS[self.sort_index]
+
+        self.sort_button.set_label(label)
+        self.walker.set_sort(sort)
 
     #---------------------------------------------------------------------------------------------#
     # select_sensor - When Sensor is selected from the list                                       #
     #---------------------------------------------------------------------------------------------#
-    def select_sensor(self, btn, idx):
-        sensor = globals.discovered_sensors[idx]
-            
+    def select_sensor(self, btn, sensor):
         if sensor not in self.selected_sensors:
-            self.selected_sensors.append(sensor)
+            self.selected_sensors[sensor] = None
         else:
-            self.selected_sensors.remove(sensor)
+            del self.selected_sensors[sensor]
             
         # Deselect the Automatic-button
         if self.automatic_button:
-            self.automatic_button.selected = False
-            self.automatic_button.attr_map.set_attr_map({None: "button"})
-            self.automatic_button.attr_map.set_focus_map({None: "button_focused"})
\ No newline at end of file
+            self.automatic_button.set_selected(False)
\ No newline at end of file
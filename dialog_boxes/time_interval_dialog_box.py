@@ -1,5 +1,4 @@
 import urwid
-import json
 
 import globals
 from constants import *
@@ -105,12 +104,7 @@ class TimeIntervalDialogBox:
             self.owner.main_screen.refresh_info()
 
         # Save settings...
-        try:
-            with open(SETTINGS_PATH, 'w') as f:
-                json.dump(globals.settings, f, indent=4)
-        except IOError:
-            print(f"{SETTINGS_PATH}: Could not write file. Please check if you have write permissions.")
-            exit(1)
+        globals.settings_store.save()
 
         # Go back
         self.back()
\ No newline at end of file
@@ -1,7 +1,15 @@
+aio_loop = None
 loop = None
+ui_bridge = None
 settings = {}
-discovered_sensors = []
-time_stamps = {}
+settings_store = None
+sensors = None
 auth = None
-db = None
-run_flag = None
\ No newline at end of file
+firebase = None
+http_session = None
+device_node = None
+ble_source = None
+broadcaster = None
+metrics = None
+firebase_config = None
+startup_profile = None
\ No newline at end of file
@@ -0,0 +1,87 @@
+import asyncio
+import signal
+import sqlite3
+import sys
+
+import globals
+from constants import *
+from broadcasting.broadcaster import Broadcaster
+from startup_profile import mark
+
+#------------------------------------------------------------------------------------------------#
+#                                          RUN HEADLESS                                          #
+#------------------------------------------------------------------------------------------------#
+def run_headless() -> None:
+    """
+    Broadcasts the followed sensors without the user interface until SIGTERM or SIGINT.
+
+    Uses the credentials and settings saved by the control panel, so the user has to
+    log in once with the user interface before the headless mode can be used.
+    """
+    # Has the user logged in?
+    if 'user_uid' not in globals.settings or 'refresh_token' not in globals.settings:
+        # No...
+        print(f"{SETTINGS_PATH}: No saved login. Please log in once without --headless.")
+        sys.exit(1)
+
+    exit_code = globals.aio_loop.run_until_complete(_broadcast())
+
+    # Write pending settings changes, e.g. a refreshed token
+    try:
+        globals.settings_store.flush()
+    except IOError:
+        print(f"{SETTINGS_PATH}: Could not write file. Please check if you have write permissions.")
+        sys.exit(1)
+
+    if exit_code:
+        sys.exit(exit_code)
+
+#------------------------------------------------------------------------------------------------#
+#                                           BROADCAST                                            #
+#------------------------------------------------------------------------------------------------#
+async def _broadcast() -> int:
+    stop_event = asyncio.Event()
+
+    # Stop broadcasting on SIGTERM and SIGINT
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+    loop.add_signal_handler(signal.SIGINT, stop_event.set)
+
+    broadcaster = Broadcaster()
+    try:
+        broadcaster.start()
+    except sqlite3.Error as e:
+        print(f"{SPOOL_PATH}: Could not open the spool: {e}")
+        sys.exit(1)
+    except OSError as e:
+        print(f"{HISTORY_PATH}: Could not open the history: {e}")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"{SETTINGS_PATH}: {e}")
+        sys.exit(1)
+
+    print("Broadcasting...", flush=True)
+    mark("broadcasting started")
+
+    # Log the pipeline counters until stopped
+    scan_error = None
+    while True:
+        try:
+            await asyncio.wait_for(stop_event.wait(), STATUS_LOG_INTERVAL)
+            break
+        except asyncio.TimeoutError:
+            print(broadcaster.status_text().replace("\n", "  "), flush=True)
+
+        # Has the scan task died?
+        scan_error = broadcaster.scan_error()
+        if scan_error is not None:
+            # Yes...
+            break
+
+    print("Stopping...", flush=True)
+    await broadcaster.stop()
+
+    if scan_error is not None:
+        print(f"Broadcasting stopped: {scan_error}", flush=True)
+        return 1
+    return 0
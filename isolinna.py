@@ -1,20 +1,70 @@
+import sys
+
+# --profile-startup has to start measuring before the other imports
+if "--profile-startup" in sys.argv:
+    from startup_profile import StartupProfile
+    startup_profile = StartupProfile()
+    startup_profile.start()
+else:
+    startup_profile = None
+
 import os
+import asyncio
 import json
 import uuid
-import pyrebase
 import time
-import sys
+import argparse
+import atexit
 
 import globals
 
-from login_screen import LoginScreen
-from main_screen import MainScreen
+from settings_store import SettingsStore
+from metrics import MetricsRegistry, MetricsExporter
+from cloud.firebase_app import missing_keys, preload_firebase
+from startup_profile import mark
+from broadcasting.ble_source import BleSource
+from broadcasting.sensor_readers import make_reader
+from sensor_registry import SensorRegistry
 from constants import *
 
 #------------------------------------------------------------------------------------------------#
 #                                              MAIN                                              #
 #------------------------------------------------------------------------------------------------#
 def main():
+    parser = argparse.ArgumentParser(description="IsoLinna Control Panel")
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="broadcast the followed sensors without the user interface (e.g. as a systemd service)"
+    )
+    parser.add_argument("--record", metavar="FILE", help="write the raw advertisements to a capture file")
+    parser.add_argument("--replay", metavar="FILE", help="read the sensors from a capture file instead of Bluetooth")
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1,
+        metavar="SPEED",
+        help="replay speed, e.g. 1 or 10. 0 replays as fast as possible (default: 1)"
+    )
+    parser.add_argument("--replay-repeat", action="store_true", help="start the capture file over at the end")
+    parser.add_argument("--synthetic", type=int, metavar="TAGS", help="generate readings for TAGS made-up sensors")
+    parser.add_argument(
+        "--synthetic-rate",
+        type=float,
+        default=1,
+        metavar="HZ",
+        help="readings per second per made-up sensor. 0 generates as fast as possible (default: 1)"
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print the time of every start-up phase and the slowest imports, then quit at the first frame"
+    )
+    args = parser.parse_args()
+
+    globals.startup_profile = startup_profile
+    mark("imports")
+
     firebase_config = {}
     # Load settings...
 
@@ -28,8 +78,6 @@ def main():
             try:
                 with open(SETTINGS_PATH, 'r') as f:
                     globals.settings = json.load(f)
-                    # initialise discovered_sensors
-                    globals.discovered_sensors = globals.settings['followed_sensors'].copy()
             except IOError:
                 print(f"{SETTINGS_PATH}: Could not open file. Please check the file's permissions.")
                 sys.exit(1)
@@ -48,10 +96,41 @@ def main():
         globals.settings["broadcasting"] = False
         globals.settings['followed_sensors'] = []
 
+    mark("settings")
+
+    # Metrics are collected only when they are exported
+    metrics_port = globals.settings.get('metrics_port')
+    metrics_file = globals.settings.get('metrics_file')
+    globals.metrics = MetricsRegistry(enabled=bool(metrics_port or metrics_file))
+
+    # Is the metrics exporter needed?
+    if globals.metrics.enabled:
+        # Yes...
+        exporter = MetricsExporter(
+            globals.metrics,
+            port=metrics_port,
+            file_path=metrics_file,
+            interval=globals.settings.get('metrics_interval', METRICS_DUMP_INTERVAL),
+        )
+        try:
+            exporter.start()
+        except OSError as e:
+            print(f"Could not start the metrics endpoint on port {metrics_port}: {e}")
+            sys.exit(1)
+        atexit.register(exporter.stop)
+
+    # The followed sensors are known before they are seen
+    globals.sensors = SensorRegistry(globals.settings['followed_sensors'])
+
+    # All further changes to the settings are written through the settings store
+    globals.settings_store = SettingsStore(globals.settings)
+
+    # Is this the first start?
+    if not os.path.isfile(SETTINGS_PATH):
+        # Yes...
         # Save settings to settings-file
         try:
-            with open(SETTINGS_PATH, 'w') as f:
-                json.dump(globals.settings, f, indent=4) 
+            globals.settings_store.flush()
         except IOError:
             print(f"{SETTINGS_PATH}: Could not write file. Please check if you have write permissions.")
             sys.exit(1)
@@ -85,25 +164,40 @@ def main():
 
     # Setup Firebase...
 
-    try:
-        firebase = pyrebase.initialize_app(firebase_config)
-        globals.auth = firebase.auth()
-        globals.db = firebase.database()
-    except KeyError as e:
-        print(f"Firebase configuration is missing a required key: {e}")
-        sys.exit(1) 
-    except ValueError as e:
-        print(f"Invalid value in Firebase configuration: {e}")
-        sys.exit(1)
-    except TypeError as e:
-        print(f"Incorrect Firebase configuration format: {e}")
-        sys.exit(1)
-    except AttributeError as e:
-        print(f"Error initializing Firebase services: {e}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+    # Is the configuration complete?
+    missing = missing_keys(firebase_config)
+    if missing:
+        # No...
+        print(f"Firebase configuration is missing a required key: {', '.join(missing)}")
         sys.exit(1)
+
+    # Yes...
+    # pyrebase is imported in the background while the screen draws. The login and
+    # the broadcaster wait for it if it isn't done yet.
+    globals.firebase_config = firebase_config
+    preload_firebase()
+
+    mark("configuration")
+
+    # Scanning, uploading and the user interface share one asyncio loop
+    globals.aio_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(globals.aio_loop)
+    globals.ble_source = BleSource(globals.aio_loop, globals.sensors, make_reader(args, globals.settings))
+
+    mark("asyncio loop and BLE source")
+
+    # Run without the user interface?
+    if args.headless:
+        # Yes...
+        from headless import run_headless
+        run_headless()
+        return
+
+    # The user interface is imported only when it is used
+    from login_screen import LoginScreen
+    from main_screen import MainScreen
+
+    mark("user interface imports")
     
     # Main loop...
     while True:
@@ -127,12 +221,7 @@ def main():
                 globals.settings['token_expiration_time'] = int(time.time()) + int(user['expiresIn'])
 
                 # Save settings to settings-file
-                try:
-                    with open(SETTINGS_PATH, 'w') as f:
-                        json.dump(globals.settings, f, indent=4) 
-                except IOError:
-                    print(f"{SETTINGS_PATH}: Could not write file. Please check if you have write permissions.")
-                    sys.exit(1)
+                globals.settings_store.save()
 
                 
 
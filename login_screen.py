@@ -5,6 +5,8 @@ import urwid
 
 import globals
 from buttons.custom_button import CustomButton
+from cloud.firebase_app import ensure_firebase
+from cloud.resilience import AUTH, PERMANENT, classify_error
 
 #-------------------------------------------------------------------------------------------------#
 #                                           LoginScreen                                           #
@@ -153,10 +155,28 @@ class LoginScreen:
         elif password == "":
             self.show_error_box("Please enter your password.")
         else:
+            # Usually done already by the preload at start-up. A failure here is in the
+            # configuration or the installation, so it can't be fixed on this screen.
+            try:
+                ensure_firebase()
+            except Exception as e:
+                sys.exit(f"Error initializing Firebase services: {e}")
+
+            # Imported here, after Firebase is set up, so the start-up stays fast
+            from requests.exceptions import HTTPError, RequestException
+
             try:
                 self.user = globals.auth.sign_in_with_email_and_password(email, password)
-            except:
-                self.show_error_box("Invalid email or password!")
+            except HTTPError as e:
+                # Did Firebase reject the credentials?
+                if classify_error(e) in (AUTH, PERMANENT):
+                    # Yes...
+                    self.show_error_box("Invalid email or password!")
+                else:
+                    # No...
+                    self.show_error_box("Firebase is not available. Please try again later.")
+            except RequestException:
+                self.show_error_box("Could not connect to Firebase. Please check the network connection.")
 
             if self.user != None:
                 raise urwid.ExitMainLoop()
@@ -178,6 +198,15 @@ class LoginScreen:
     # main - Opens the screen and starts the rendering loop                                       #
     #---------------------------------------------------------------------------------------------#
     def main(self) -> dict:
-        self.loop = urwid.MainLoop(self.view, self.palette, unhandled_input=self.unhandled_key)
+        self.loop = urwid.MainLoop(
+            self.view,
+            self.palette,
+            unhandled_input=self.unhandled_key,
+            event_loop=urwid.AsyncioEventLoop(loop=globals.aio_loop)
+        )
+
+        if globals.startup_profile is not None:
+            globals.startup_profile.watch_first_frame(self.loop, "login screen")
+
         self.loop.run()
         return self.user
\ No newline at end of file
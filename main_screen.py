@@ -2,7 +2,9 @@ from __future__ import annotations
 import urwid
 import sys
 import globals
+from ui_bridge import UiBridge
 from menus.main_menu import MainMenu
+from widgets.sensor_dashboard import SensorDashboard
 
 #-------------------------------------------------------------------------------------------------#
 #                                           MainScreen                                            #
@@ -26,6 +28,7 @@ class MainScreen:
     #---------------------------------------------------------------------------------------------#
     def __init__(self, width: int, height: int) -> None:
         self.login = True
+        self.quitting = False
 
         self.width = width
         if self.width <= 0:
@@ -85,13 +88,18 @@ class MainScreen:
         info_box = urwid.AttrMap(info_box, "body")
         #----------------------------------------
 
+        # Sensor Dashboard ----------------------
+        self.dashboard = SensorDashboard()
+        #----------------------------------------
+
         # --------- MAIN MENU AT BOTTOM ---------
         self.main_menu = MainMenu(main_screen=self)
 
-        # Stack title, info, and menu
+        # Stack title, info, dashboard and menu
         layout = urwid.Pile([
             ("pack", title_box),
             ("pack", info_box),
+            self.dashboard,
             self.main_menu.top,
         ])
         #----------------------------------------
@@ -107,10 +115,15 @@ class MainScreen:
     #---------------------------------------------------------------------------------------------#
     def unhandled_key(self, k: str) -> None:
         if k in ("q", "Q"):
-            if globals.run_flag != None and globals.run_flag == True:
-                globals.run_flag.running = False
-            sys.exit(0)
-            
+            self.quit()
+
+    #---------------------------------------------------------------------------------------------#
+    # quit - Leaves the main loop and quits the program after broadcasting has stopped            #
+    #---------------------------------------------------------------------------------------------#
+    def quit(self) -> None:
+        self.quitting = True
+        raise urwid.ExitMainLoop()
+
     #---------------------------------------------------------------------------------------------#
     # refresh_info - Updates the Device Information                                               #
     #---------------------------------------------------------------------------------------------#
@@ -132,10 +145,32 @@ class MainScreen:
     # main - Opens the screen and starts the rendering loop                                       #
     #---------------------------------------------------------------------------------------------#
     def main(self) -> None:
-        globals.loop = urwid.MainLoop(self.view, self.palette, unhandled_input=self.unhandled_key)
+        globals.loop = urwid.MainLoop(
+            self.view,
+            self.palette,
+            unhandled_input=self.unhandled_key,
+            event_loop=urwid.AsyncioEventLoop(loop=globals.aio_loop)
+        )
+
+        # Background tasks update the UI through the bridge
+        globals.ui_bridge = UiBridge(globals.loop)
+
+        self.dashboard.start(globals.loop)
 
         # If broadcasting...
         if globals.settings.get('broadcasting'):
             self.main_menu.start_broadcasting()
-            
+
+        if globals.startup_profile is not None:
+            globals.startup_profile.watch_first_frame(globals.loop, "main screen")
+
         globals.loop.run()
+        self.dashboard.stop()
+        globals.ui_bridge.close()
+
+        # Readings still in memory go to the spool before leaving the screen
+        if globals.broadcaster is not None:
+            globals.aio_loop.run_until_complete(globals.broadcaster.stop())
+
+        if self.quitting:
+            sys.exit(0)
@@ -1,11 +1,6 @@
 from __future__ import annotations
 
 import urwid
-import json
-import sys
-import os
-import time
-from datetime import datetime, timezone
 
 import globals
 from constants import *
@@ -13,14 +8,7 @@ from constants import *
 from menus.cascading_boxes import CascadingBoxes
 from menus.menu import Menu
 from menus.settings_menu import MenuButton, SettingsMenu
-from dialog_boxes.sensors_dialog_box import SensorsDialogBox
 from buttons.custom_button import CustomButton
-from dialog_boxes.broadcasting_dialog_box import BroadcastingDialogBox
-
-# NOTE: This must be set before importing ruuvitag_sensor.
-os.environ["RUUVI_BLE_ADAPTER"] = "bluez"
-
-from ruuvitag_sensor.ruuvi import RuuviTagSensor, RunFlag
 
 #-------------------------------------------------------------------------------------------------#
 #                                            MainMenu                                             #
@@ -39,7 +27,7 @@ class MainMenu:
             "Main Menu",
             [
                 MenuButton("Start broadcasting", self.start_broadcasting),
-                MenuButton("Sensors", lambda *_: SensorsDialogBox(self)),
+                MenuButton("Sensors", self.open_sensors),
                 SettingsMenu(self, globals.settings),
                 MenuButton("Log out", self.logout),
                 MenuButton("Quit", self.quit),
@@ -62,14 +50,18 @@ class MainMenu:
         if not globals.settings['broadcasting']:
             globals.settings['broadcasting'] = True
 
-            try:
-                with open(SETTINGS_PATH, 'w') as f:
-                    json.dump(globals.settings, f, indent=4)
-            except IOError:
-                print(f"[bold red]{SETTINGS_PATH}: Could not write file. Please check if you have write permissions.")
-                exit(1)
+            globals.settings_store.save()
 
+        # The broadcasting pipeline is imported when it is first needed
+        from dialog_boxes.broadcasting_dialog_box import BroadcastingDialogBox
         BroadcastingDialogBox()
+
+    #---------------------------------------------------------------------------------------------#
+    # open_sensors - Opens the sensors dialog                                                     #
+    #---------------------------------------------------------------------------------------------#
+    def open_sensors(self, *_args):
+        from dialog_boxes.sensors_dialog_box import SensorsDialogBox
+        SensorsDialogBox(self)
     
     #---------------------------------------------------------------------------------------------#
     # logout - Logs out the current user                                                          #
@@ -83,12 +75,7 @@ class MainMenu:
         del globals.settings['token_expiration_time']
 
         # Save settings to settings-file
-        try:
-            with open(SETTINGS_PATH, 'w') as f:
-                json.dump(globals.settings, f, indent=4)
-        except IOError:
-            print(f"[bold red]{SETTINGS_PATH}: Could not write file. Please check if you have write permissions.")
-            sys.exit(1)
+        globals.settings_store.save()
 
         raise urwid.ExitMainLoop()
     
@@ -96,4 +83,4 @@ class MainMenu:
     # quit - quits the program                                                                    #
     #---------------------------------------------------------------------------------------------#
     def quit(self, *_args):
-        sys.exit(0)
+        self.main_screen.quit()
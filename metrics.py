@@ -0,0 +1,355 @@
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from constants import *
+
+# Default histogram buckets in seconds
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+#-------------------------------------------------------------------------------------------------#
+#                                             Counter                                             #
+#-------------------------------------------------------------------------------------------------#
+class Counter:
+    """
+    Value that only goes up. function, if given, is called for the value when the
+    metrics are read, instead of counting with inc().
+    """
+    __slots__ = ("value", "function")
+    kind = "counter"
+
+    def __init__(self, function=None) -> None:
+        self.value = 0
+        self.function = function
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def read(self):
+        return self.function() if self.function is not None else self.value
+
+#-------------------------------------------------------------------------------------------------#
+#                                              Gauge                                              #
+#-------------------------------------------------------------------------------------------------#
+class Gauge:
+    """
+    Value that goes up and down. function, if given, is called for the value when the
+    metrics are read, so e.g. a queue depth costs nothing until someone asks for it.
+    """
+    __slots__ = ("value", "function")
+    kind = "gauge"
+
+    def __init__(self, function=None) -> None:
+        self.value = 0
+        self.function = function
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def read(self):
+        return self.function() if self.function is not None else self.value
+
+#-------------------------------------------------------------------------------------------------#
+#                                            Histogram                                            #
+#-------------------------------------------------------------------------------------------------#
+class Histogram:
+    """
+    Distribution of observed values in fixed buckets, like a Prometheus histogram.
+    """
+    __slots__ = ("buckets", "counts", "sum", "count")
+    kind = "histogram"
+
+    def __init__(self, buckets=LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def read(self) -> dict:
+        cumulative = []
+        total = 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+
+        return {
+            'buckets': dict(zip([*map(str, self.buckets), "+Inf"], cumulative)),
+            'sum': self.sum,
+            'count': self.count,
+        }
+
+#-------------------------------------------------------------------------------------------------#
+#                                           _NullMetric                                           #
+#-------------------------------------------------------------------------------------------------#
+class _NullMetric:
+    """
+    Stands in for every metric when the metrics are disabled. Its methods do nothing.
+    """
+    __slots__ = ()
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+NULL_METRIC = _NullMetric()
+
+#-------------------------------------------------------------------------------------------------#
+#                                         MetricsRegistry                                         #
+#-------------------------------------------------------------------------------------------------#
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms of the application.
+
+    Components ask for their metrics once, when they are created, and keep them. When
+    the registry is disabled every metric is the same object whose methods do nothing,
+    so the instrumentation costs one empty method call. Asking again for a metric with
+    the same name and labels returns the existing one, so a restarted component
+    continues its counts. A function given for a counter or a gauge replaces the old one.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, enabled: bool = True, prefix: str = METRICS_PREFIX) -> None:
+        self.enabled = enabled
+        self.prefix = prefix
+
+        self._metrics = {}      # (name, labels) -> metric, in the order they were made
+        self._help = {}         # name -> help text
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str = "", labels: dict | None = None, function=None):
+        return self._get(Counter, name, help, labels, function=function)
+
+    def gauge(self, name: str, help: str = "", labels: dict | None = None, function=None):
+        return self._get(Gauge, name, help, labels, function=function)
+
+    def histogram(self, name: str, help: str = "", labels: dict | None = None, buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    #---------------------------------------------------------------------------------------------#
+    # snapshot - Returns every metric as a dictionary                                             #
+    #---------------------------------------------------------------------------------------------#
+    def snapshot(self) -> dict:
+        metrics = {}
+        for (name, labels), metric in self._items():
+            key = self.prefix + name + _format_labels(labels)
+            metrics[key] = _read(metric)
+
+        return {'timestamp': time.time(), 'metrics': metrics}
+
+    #---------------------------------------------------------------------------------------------#
+    # render_prometheus - Returns every metric in the Prometheus text format                      #
+    #---------------------------------------------------------------------------------------------#
+    def render_prometheus(self) -> str:
+        lines = []
+        described = set()
+
+        # The metrics of one name must be listed together
+        items = self._items()
+        order = {}
+        for (name, labels), metric in items:
+            order.setdefault(name, len(order))
+        items.sort(key=lambda item: order[item[0][0]])
+
+        for (name, labels), metric in items:
+            full_name = self.prefix + name
+
+            # HELP and TYPE once per name
+            if name not in described:
+                described.add(name)
+                if self._help.get(name):
+                    lines.append(f"# HELP {full_name} {self._help[name]}")
+                lines.append(f"# TYPE {full_name} {metric.kind}")
+
+            value = _read(metric)
+
+            if metric.kind != "histogram":
+                lines.append(f"{full_name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+
+            for bound, count in value['buckets'].items():
+                lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', bound),))} {count}")
+            lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+            lines.append(f"{full_name}_count{_format_labels(labels)} {value['count']}")
+
+        return "\n".join(lines) + "\n"
+
+    #---------------------------------------------------------------------------------------------#
+    # _get - Returns the metric with the name and labels, making it if needed                     #
+    #---------------------------------------------------------------------------------------------#
+    def _get(self, metric_class, name: str, help: str, labels: dict | None, function=None, **kwargs):
+        if not self.enabled:
+            return NULL_METRIC
+
+        key = (name, tuple(sorted(labels.items())) if labels else ())
+
+        with self._lock:
+            metric = self._metrics.get(key)
+
+            # Does the metric exist?
+            if metric is None:
+                # No...
+                metric = metric_class(function=function) if function is not None else metric_class(**kwargs)
+                self._metrics[key] = metric
+                if help:
+                    self._help[name] = help
+            elif function is not None:
+                # Yes...
+                # A restarted component brings a new function
+                metric.function = function
+
+        return metric
+
+    def _items(self) -> list:
+        with self._lock:
+            return list(self._metrics.items())
+
+#-------------------------------------------------------------------------------------------------#
+#                                         MetricsExporter                                         #
+#-------------------------------------------------------------------------------------------------#
+class MetricsExporter:
+    """
+    Makes the metrics available outside the application.
+
+    With a port, a local HTTP server answers GET /metrics in the Prometheus text format.
+    With a file path, a snapshot of the metrics is written to the file as JSON every
+    interval seconds and when the exporter stops. Both run in daemon threads, so they
+    work the same under the user interface and in the headless mode.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, registry: MetricsRegistry, port: int | None = None, file_path: str | None = None,
+                 interval: float = METRICS_DUMP_INTERVAL, host: str = METRICS_HOST) -> None:
+        self.registry = registry
+        self.port = port
+        self.file_path = file_path
+        self.interval = interval
+        self.host = host
+
+        self._server = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    #---------------------------------------------------------------------------------------------#
+    # start - Starts the HTTP server and the dump thread. Raises OSError if the port is in use.   #
+    #---------------------------------------------------------------------------------------------#
+    def start(self) -> None:
+        if self.port:
+            self._server = ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+            self._server.daemon_threads = True
+            self._server.registry = self.registry
+            self._start_thread(self._server.serve_forever, "metrics-http")
+
+        if self.file_path:
+            self._start_thread(self._dump_periodically, "metrics-dump")
+
+    #---------------------------------------------------------------------------------------------#
+    # stop - Stops the threads and writes the last snapshot                                       #
+    #---------------------------------------------------------------------------------------------#
+    def stop(self) -> None:
+        self._stop.set()
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        if self.file_path:
+            self.dump()
+
+    #---------------------------------------------------------------------------------------------#
+    # dump - Writes a snapshot to the file. The file is replaced atomically.                      #
+    #---------------------------------------------------------------------------------------------#
+    def dump(self) -> None:
+        temp_path = f"{self.file_path}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(self.registry.snapshot(), f, indent=4)
+            os.replace(temp_path, self.file_path)
+        except OSError:
+            self.registry.counter("metrics_dump_failures_total", "Failed writes of the metrics file").inc()
+
+    def _dump_periodically(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def _start_thread(self, target, name: str) -> None:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+#-------------------------------------------------------------------------------------------------#
+#                                         _MetricsHandler                                         #
+#-------------------------------------------------------------------------------------------------#
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET /metrics of the metrics exporter.
+    """
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        # The user interface owns the terminal
+        pass
+
+#-------------------------------------------------------------------------------------------------#
+#                                         Helper functions                                        #
+#-------------------------------------------------------------------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+# _read - Reads a metric. A failing function reads as None.                                       #
+#-------------------------------------------------------------------------------------------------#
+def _read(metric):
+    try:
+        return metric.read()
+    except Exception:
+        return None
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+def _format_value(value) -> str:
+    if value is None:
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,116 @@
+import time
+
+#-------------------------------------------------------------------------------------------------#
+#                                          SensorRecord                                           #
+#-------------------------------------------------------------------------------------------------#
+class SensorRecord:
+    """
+    What is known about one sensor. Times are UNIX timestamps, or None if the event
+    has not happened yet. last_upload is when the sampling policy last accepted a
+    reading, last_sent when a reading of the sensor last reached Firebase. data is the
+    sensor's latest reading.
+    """
+    __slots__ = ("mac_address", "first_seen", "last_seen", "rssi", "data_format", "followed", "last_upload",
+                 "last_sent", "data")
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, mac_address: str, followed: bool = False) -> None:
+        self.mac_address = mac_address
+        self.first_seen = None
+        self.last_seen = None
+        self.rssi = None
+        self.data_format = None
+        self.followed = followed
+        self.last_upload = None
+        self.last_sent = None
+        self.data = None
+
+#-------------------------------------------------------------------------------------------------#
+#                                         SensorRegistry                                          #
+#-------------------------------------------------------------------------------------------------#
+class SensorRegistry:
+    """
+    Every known sensor keyed by MAC address, in the order the sensors became known.
+
+    The BLE source updates the registry once per advertisement, and the scanner, the
+    broadcaster and the sensors dialog read it. Lookups and updates are O(1). The
+    registry is only used from the asyncio loop, so it needs no locking.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, followed_sensors=()) -> None:
+        self._records = {}
+        self._followed = {}     # Followed MACs in the saved order (dict keeps the order)
+
+        self.set_followed(followed_sensors)
+
+    def __contains__(self, mac_address: str) -> bool:
+        return mac_address in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records.values())
+
+    #---------------------------------------------------------------------------------------------#
+    # get - Returns the record of a sensor, or None if the sensor is unknown                      #
+    #---------------------------------------------------------------------------------------------#
+    def get(self, mac_address: str) -> SensorRecord | None:
+        return self._records.get(mac_address)
+
+    #---------------------------------------------------------------------------------------------#
+    # update - Records an advertisement and returns the sensor's record                           #
+    #---------------------------------------------------------------------------------------------#
+    def update(self, mac_address: str, sensor_data: dict, timestamp: float | None = None) -> SensorRecord:
+        if timestamp is None:
+            timestamp = time.time()
+
+        record = self._records.get(mac_address)
+
+        # Is this a new sensor?
+        if record is None:
+            # Yes...
+            record = SensorRecord(mac_address)
+            self._records[mac_address] = record
+
+        if record.first_seen is None:
+            record.first_seen = timestamp
+        record.last_seen = timestamp
+        record.rssi = sensor_data.get('rssi')
+        record.data_format = sensor_data.get('data_format')
+        record.data = sensor_data
+
+        return record
+
+    #---------------------------------------------------------------------------------------------#
+    # is_followed - Tells if a sensor is followed                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def is_followed(self, mac_address: str) -> bool:
+        return mac_address in self._followed
+
+    #---------------------------------------------------------------------------------------------#
+    # followed - Returns the followed MAC addresses in the saved order                            #
+    #---------------------------------------------------------------------------------------------#
+    def followed(self) -> list:
+        return list(self._followed)
+
+    #---------------------------------------------------------------------------------------------#
+    # set_followed - Replaces the followed sensors. Unknown sensors are added to the registry.    #
+    #---------------------------------------------------------------------------------------------#
+    def set_followed(self, mac_addresses) -> None:
+        for mac_address in self._followed:
+            self._records[mac_address].followed = False
+
+        self._followed = dict.fromkeys(mac_addresses)
+
+        for mac_address in self._followed:
+            record = self._records.get(mac_address)
+            if record is None:
+                record = SensorRecord(mac_address)
+                self._records[mac_address] = record
+            record.followed = True
@@ -0,0 +1,127 @@
+import atexit
+import json
+import os
+import threading
+
+import globals
+from constants import *
+
+#-------------------------------------------------------------------------------------------------#
+#                                          SettingsStore                                          #
+#-------------------------------------------------------------------------------------------------#
+class SettingsStore:
+    """
+    Single place where the settings are written to the settings-file.
+
+    Callers change the settings dictionary in memory and call save(). The store
+    writes the file `delay` seconds after the first unsaved change, so a burst of
+    changes costs one write. The file is written to a temporary file, synced
+    and renamed over the old one, so it is never left half-written. Pending changes
+    are written when the program exits.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, settings: dict, path: str = SETTINGS_PATH, delay: float = SETTINGS_SAVE_DELAY) -> None:
+        self.settings = settings
+        self.path = path
+        self.delay = delay
+        self.writes = 0
+
+        self.write_metric = globals.metrics.counter("settings_writes_total", "Settings-file writes")
+        self.failure_metric = globals.metrics.counter("settings_write_failures_total", "Failed settings-file writes")
+
+        self._lock = threading.Lock()        # Guards the dirty flag and the timer
+        self._write_lock = threading.Lock()  # Only one thread writes the file at a time
+        self._dirty = False
+        self._timer = None
+
+        atexit.register(self._flush_at_exit)
+
+    #---------------------------------------------------------------------------------------------#
+    # save - Marks the settings changed. The file is written after the debounce delay.            #
+    #---------------------------------------------------------------------------------------------#
+    def save(self) -> None:
+        with self._lock:
+            self._dirty = True
+
+            # Is a write already scheduled?
+            if self._timer is not None:
+                # Yes...
+                # It will write this change too
+                return
+
+            self._timer = threading.Timer(self.delay, self._flush_later)
+            self._timer.daemon = True
+            self._timer.start()
+
+    #---------------------------------------------------------------------------------------------#
+    # flush - Writes the settings now. Raises OSError if the file can't be written.               #
+    #---------------------------------------------------------------------------------------------#
+    def flush(self) -> None:
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                self._dirty = False
+
+                # Take a snapshot so other threads can keep changing the settings
+                data = json.dumps(self.settings.copy(), indent=4)
+
+            try:
+                self._write(data)
+            except OSError:
+                self.failure_metric.inc()
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    #---------------------------------------------------------------------------------------------#
+    # _write - Replaces the settings-file atomically                                              #
+    #---------------------------------------------------------------------------------------------#
+    def _write(self, data: str) -> None:
+        temp_path = f"{self.path}.tmp"
+
+        with open(temp_path, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp_path, self.path)
+        self.writes += 1
+        self.write_metric.inc()
+
+        # Make the rename itself durable
+        try:
+            directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(directory)
+        except OSError:
+            pass
+        finally:
+            os.close(directory)
+
+    #---------------------------------------------------------------------------------------------#
+    # _flush_later - Timer callback                                                               #
+    #---------------------------------------------------------------------------------------------#
+    def _flush_later(self) -> None:
+        with self._lock:
+            self._timer = None
+            if not self._dirty:
+                return
+
+        try:
+            self.flush()
+        except OSError:
+            print(f"{self.path}: Could not write file. Please check if you have write permissions.")
+
+    #---------------------------------------------------------------------------------------------#
+    # _flush_at_exit - Writes pending changes when the program exits                              #
+    #---------------------------------------------------------------------------------------------#
+    def _flush_at_exit(self) -> None:
+        if self._dirty:
+            self._flush_later()
@@ -0,0 +1,142 @@
+import atexit
+import builtins
+import importlib.util
+import sys
+import threading
+import time
+
+import globals
+
+#-------------------------------------------------------------------------------------------------#
+#                                         StartupProfile                                          #
+#-------------------------------------------------------------------------------------------------#
+class StartupProfile:
+    """
+    Measures where the start-up time goes, for --profile-startup.
+
+    start() replaces __import__ with a version that times every import that loads new
+    modules, so it must run before the other imports of isolinna.py. Imports made by
+    background threads, e.g. the Firebase preload, are listed with the thread's name.
+    mark() records the end of an initialization phase. The report is printed when the program exits,
+    after the user interface has given the terminal back.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, top: int = 20) -> None:
+        self.top = top
+        self.started = None
+        self.marks = []         # (phase, time)
+        self.imports = {}       # Module name -> [cumulative time, self time]
+
+        self._original_import = None
+        self._local = threading.local()     # Per thread: time spent in nested imports, per import in progress
+
+    #---------------------------------------------------------------------------------------------#
+    # start - Starts measuring                                                                    #
+    #---------------------------------------------------------------------------------------------#
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+        atexit.register(self.print_report)
+
+    #---------------------------------------------------------------------------------------------#
+    # mark - Records the end of a phase                                                           #
+    #---------------------------------------------------------------------------------------------#
+    def mark(self, phase: str) -> None:
+        self.marks.append((phase, time.perf_counter()))
+
+    #---------------------------------------------------------------------------------------------#
+    # watch_first_frame - Marks the first frame of a urwid main loop and quits                    #
+    #---------------------------------------------------------------------------------------------#
+    def watch_first_frame(self, loop, screen: str) -> None:
+        def first_frame(*_args):
+            loop.draw_screen()
+            self.mark(f"first frame ({screen})")
+            sys.exit(0)
+
+        loop.set_alarm_in(0, first_frame)
+
+    #---------------------------------------------------------------------------------------------#
+    # report - Returns the phases and the slowest imports as text                                 #
+    #---------------------------------------------------------------------------------------------#
+    def report(self) -> str:
+        lines = ["Start-up profile", "", f"{'Phase':<40} {'ms':>9} {'total ms':>9}"]
+
+        previous = self.started
+        for phase, at in self.marks:
+            lines.append(f"{phase:<40} {(at - previous) * 1000:9.1f} {(at - self.started) * 1000:9.1f}")
+            previous = at
+
+        lines += ["", f"{'Import':<40} {'self ms':>9} {'cumul ms':>9}"]
+
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)[:self.top]
+        for name, (cumulative, own) in slowest:
+            lines.append(f"{name:<40} {own * 1000:9.1f} {cumulative * 1000:9.1f}")
+
+        return "\n".join(lines)
+
+    def print_report(self) -> None:
+        builtins.__import__ = self._original_import
+        print(self.report())
+
+    #---------------------------------------------------------------------------------------------#
+    # _timed_import - __import__ that times the imports that load new modules                     #
+    #---------------------------------------------------------------------------------------------#
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Already imported modules cost nothing worth measuring
+        if level == 0 and name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        modules = len(sys.modules)
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = stack.pop()
+
+            # The parent's own time doesn't include this import
+            if stack:
+                stack[-1] += elapsed
+
+            if len(sys.modules) != modules:
+                entry = self.imports.setdefault(_module_name(name, globals, fromlist, level), [0.0, 0.0])
+                entry[0] += elapsed
+                entry[1] += elapsed - nested
+
+#-------------------------------------------------------------------------------------------------#
+# _module_name - Absolute name of an imported module, with the thread if it isn't the main thread #
+#-------------------------------------------------------------------------------------------------#
+def _module_name(name: str, globals, fromlist, level: int) -> str:
+    if level:
+        # "from . import x" imports the submodule x, not the package
+        submodules = not name and fromlist
+
+        try:
+            name = importlib.util.resolve_name("." * level + name, (globals or {}).get('__package__'))
+        except (ImportError, ValueError):
+            name = "." * level + name
+
+        if submodules:
+            name += "." + ",".join(fromlist)
+
+    thread = threading.current_thread()
+    if thread is not threading.main_thread():
+        name = f"{name} [{thread.name}]"
+
+    return name
+
+#-------------------------------------------------------------------------------------------------#
+# mark - Records the end of a phase if the start-up is profiled                                   #
+#-------------------------------------------------------------------------------------------------#
+def mark(phase: str) -> None:
+    if globals.startup_profile is not None:
+        globals.startup_profile.mark(phase)
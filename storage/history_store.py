@@ -0,0 +1,319 @@
+import bisect
+import collections
+import math
+import mmap
+import os
+import shutil
+import struct
+import time
+from datetime import datetime, timedelta, timezone
+
+from constants import *
+
+# One reading: timestamp, temperature, humidity, pressure, rssi, battery.
+# Missing values are stored as NaN (floats) or the smallest/largest integer.
+RECORD = struct.Struct("<dfffhH")
+
+# One index entry: timestamp and number of the first record of a block
+INDEX_ENTRY = struct.Struct("<dI")
+
+NO_RSSI = -32768
+NO_BATTERY = 65535
+
+#-------------------------------------------------------------------------------------------------#
+#                                          HistoryStore                                           #
+#-------------------------------------------------------------------------------------------------#
+class HistoryStore:
+    """
+    Local time-series store of the sensor readings.
+
+    Each sensor has one append-only file of fixed-width records per UTC day,
+    history/<YYYYMMDD>/<MAC>.bin. Every index_stride-th record is also written to a
+    sparse index, <MAC>.idx, so a range query finds its first block with a binary
+    search over the index and reads the records from a memory-mapped file. Records
+    are appended in time order. Days older than max_days are removed when a new day
+    starts. Only the files of the max_open_writers most recently seen sensors are kept
+    open, so the number of sensors isn't limited by the open file limit. All methods
+    must be called from the same thread.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, path: str = HISTORY_PATH, index_stride: int = HISTORY_INDEX_STRIDE,
+                 max_days: int = HISTORY_MAX_DAYS, flush_interval: float = HISTORY_FLUSH_INTERVAL,
+                 max_open_writers: int = HISTORY_MAX_OPEN_WRITERS) -> None:
+        self.path = path
+        self.index_stride = max(1, index_stride)
+        self.max_days = max_days
+        self.flush_interval = flush_interval
+        self.max_open_writers = max(1, max_open_writers)
+
+        self._writers = collections.OrderedDict()   # MAC -> _Writer of the current day, oldest first
+        self._last_flush = time.monotonic()
+        self._day = None
+
+        os.makedirs(self.path, exist_ok=True)
+
+    #---------------------------------------------------------------------------------------------#
+    # append - Stores a reading                                                                   #
+    #---------------------------------------------------------------------------------------------#
+    def append(self, mac_address: str, timestamp: float, sensor_data: dict) -> None:
+        day = _day_of(timestamp)
+
+        # Has a new day started?
+        if day != self._day:
+            # Yes...
+            self._rotate(day)
+
+        writer = self._writers.get(mac_address)
+
+        # Are the sensor's files open?
+        if writer is None or writer.day != day:
+            # No...
+            if writer is not None:
+                writer.close()
+            writer = _Writer(self._file_path(day, mac_address), day, self.index_stride)
+            self._writers[mac_address] = writer
+
+            # Close the files of the sensor seen longest ago
+            if len(self._writers) > self.max_open_writers:
+                _, oldest = self._writers.popitem(last=False)
+                oldest.close()
+
+        self._writers.move_to_end(mac_address)
+
+        writer.append(_pack(timestamp, sensor_data), timestamp)
+
+        # Don't keep readings in memory for long
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    #---------------------------------------------------------------------------------------------#
+    # flush - Writes the buffered readings to the files                                           #
+    #---------------------------------------------------------------------------------------------#
+    def flush(self) -> None:
+        for writer in self._writers.values():
+            writer.flush()
+        self._last_flush = time.monotonic()
+
+    #---------------------------------------------------------------------------------------------#
+    # close - Writes the buffered readings and closes the files                                   #
+    #---------------------------------------------------------------------------------------------#
+    def close(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = collections.OrderedDict()
+
+    #---------------------------------------------------------------------------------------------#
+    # query - Returns the readings of a sensor with start <= timestamp < end as dicts             #
+    #---------------------------------------------------------------------------------------------#
+    def query(self, mac_address: str, start: float, end: float) -> list:
+        writer = self._writers.get(mac_address)
+        if writer is not None:
+            writer.flush()
+
+        readings = []
+        day = _day_of(start)
+        last_day = _day_of(end)
+
+        while day <= last_day:
+            readings.extend(self._query_file(self._file_path(day, mac_address), start, end))
+            day += timedelta(days=1)
+
+        return readings
+
+    #---------------------------------------------------------------------------------------------#
+    # days - Returns the stored days, oldest first                                                #
+    #---------------------------------------------------------------------------------------------#
+    def days(self) -> list:
+        days = []
+        for name in os.listdir(self.path):
+            try:
+                days.append(datetime.strptime(name, "%Y%m%d").date())
+            except ValueError:
+                continue
+        return sorted(days)
+
+    #---------------------------------------------------------------------------------------------#
+    # _query_file - Reads the matching records of one day file                                    #
+    #---------------------------------------------------------------------------------------------#
+    def _query_file(self, file_path: str, start: float, end: float) -> list:
+        if not os.path.isfile(file_path) or os.path.getsize(file_path) < RECORD.size:
+            return []
+
+        # Find the block where the range starts
+        first = _first_record(file_path[:-len(".bin")] + ".idx", start)
+
+        readings = []
+        with open(file_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                count = len(data) // RECORD.size
+
+                for number in range(first, count):
+                    record = RECORD.unpack_from(data, number * RECORD.size)
+                    if record[0] >= end:
+                        break
+                    if record[0] >= start:
+                        readings.append(_unpack(record))
+
+        return readings
+
+    #---------------------------------------------------------------------------------------------#
+    # _rotate - Closes the files of the previous day and removes the expired days                 #
+    #---------------------------------------------------------------------------------------------#
+    def _rotate(self, day) -> None:
+        self.close()
+        self._day = day
+
+        if not self.max_days:
+            return
+
+        oldest = day - timedelta(days=self.max_days - 1)
+        for expired in self.days():
+            if expired < oldest:
+                shutil.rmtree(os.path.join(self.path, expired.strftime("%Y%m%d")), ignore_errors=True)
+
+    #---------------------------------------------------------------------------------------------#
+    # _file_path - Path of a sensor's record file for a day                                       #
+    #---------------------------------------------------------------------------------------------#
+    def _file_path(self, day, mac_address: str) -> str:
+        return os.path.join(self.path, day.strftime("%Y%m%d"), mac_address.replace(":", "") + ".bin")
+
+#-------------------------------------------------------------------------------------------------#
+#                                             _Writer                                             #
+#-------------------------------------------------------------------------------------------------#
+class _Writer:
+    """
+    Appends records and index entries to the files of one sensor and day.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, file_path: str, day, index_stride: int) -> None:
+        self.day = day
+        self.index_stride = index_stride
+
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        self._data = open(file_path, "ab")
+        self._index = open(file_path[:-len(".bin")] + ".idx", "a+b")
+
+        # Continue a file that was written before a restart. A record cut short by
+        # a crash is dropped, so the following records stay aligned.
+        size = self._data.tell()
+        if size % RECORD.size:
+            self._data.truncate(size - size % RECORD.size)
+            self._data.seek(0, os.SEEK_END)
+        self.count = self._data.tell() // RECORD.size
+
+        # Same for the index. Entries of records that were lost are dropped too.
+        index_size = self._index.seek(0, os.SEEK_END)
+        valid_size = index_size - index_size % INDEX_ENTRY.size
+        while valid_size:
+            self._index.seek(valid_size - INDEX_ENTRY.size)
+            if INDEX_ENTRY.unpack(self._index.read(INDEX_ENTRY.size))[1] < self.count:
+                break
+            valid_size -= INDEX_ENTRY.size
+        if valid_size != index_size:
+            self._index.truncate(valid_size)
+        self._index.seek(0, os.SEEK_END)
+
+    #---------------------------------------------------------------------------------------------#
+    # append - Appends one packed record                                                          #
+    #---------------------------------------------------------------------------------------------#
+    def append(self, record: bytes, timestamp: float) -> None:
+        if self.count % self.index_stride == 0:
+            self._index.write(INDEX_ENTRY.pack(timestamp, self.count))
+
+        self._data.write(record)
+        self.count += 1
+
+    def flush(self) -> None:
+        self._data.flush()
+        self._index.flush()
+
+    def close(self) -> None:
+        self._data.close()
+        self._index.close()
+
+#-------------------------------------------------------------------------------------------------#
+#                                        _IndexTimestamps                                         #
+#-------------------------------------------------------------------------------------------------#
+class _IndexTimestamps:
+    """
+    Read-only sequence of the timestamps in a memory-mapped index, for bisect.
+    """
+
+    def __init__(self, index, count: int) -> None:
+        self.index = index
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, position: int) -> float:
+        return INDEX_ENTRY.unpack_from(self.index, position * INDEX_ENTRY.size)[0]
+
+#-------------------------------------------------------------------------------------------------#
+#                                         Helper functions                                        #
+#-------------------------------------------------------------------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+# _day_of - UTC date of a timestamp                                                               #
+#-------------------------------------------------------------------------------------------------#
+def _day_of(timestamp: float):
+    return datetime.fromtimestamp(timestamp, timezone.utc).date()
+
+#-------------------------------------------------------------------------------------------------#
+# _first_record - Number of the first record of the block where timestamp can start               #
+#-------------------------------------------------------------------------------------------------#
+def _first_record(index_path: str, timestamp: float) -> int:
+    if not os.path.isfile(index_path) or os.path.getsize(index_path) < INDEX_ENTRY.size:
+        return 0
+
+    with open(index_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+            count = len(index) // INDEX_ENTRY.size
+            timestamps = _IndexTimestamps(index, count)
+
+            # The last block that starts before the timestamp
+            position = bisect.bisect_left(timestamps, timestamp) - 1
+            if position < 0:
+                return 0
+            return INDEX_ENTRY.unpack_from(index, position * INDEX_ENTRY.size)[1]
+
+#-------------------------------------------------------------------------------------------------#
+# _pack - Packs a reading into a record                                                           #
+#-------------------------------------------------------------------------------------------------#
+def _pack(timestamp: float, sensor_data: dict) -> bytes:
+    def value(key):
+        v = sensor_data.get(key)
+        return math.nan if v is None else v
+
+    rssi = sensor_data.get('rssi')
+    battery = sensor_data.get('battery')
+
+    return RECORD.pack(
+        timestamp,
+        value('temperature'),
+        value('humidity'),
+        value('pressure'),
+        NO_RSSI if rssi is None else rssi,
+        NO_BATTERY if battery is None else battery,
+    )
+
+#-------------------------------------------------------------------------------------------------#
+# _unpack - Converts an unpacked record into a reading                                            #
+#-------------------------------------------------------------------------------------------------#
+def _unpack(record: tuple) -> dict:
+    timestamp, temperature, humidity, pressure, rssi, battery = record
+
+    return {
+        'timestamp': timestamp,
+        'temperature': None if math.isnan(temperature) else round(temperature, 3),
+        'humidity': None if math.isnan(humidity) else round(humidity, 3),
+        'pressure': None if math.isnan(pressure) else round(pressure, 2),
+        'rssi': None if rssi == NO_RSSI else rssi,
+        'battery': None if battery == NO_BATTERY else battery,
+    }
@@ -0,0 +1,488 @@
+import argparse
+import hashlib
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Characters of the push keys, in sort order (same as Firebase)
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+SIGN_IN_PATH = "/identitytoolkit/v3/relyingparty/verifyPassword"
+REFRESH_PATH = "/v1/token"
+STATS_PATH = "/__stats"
+
+#-------------------------------------------------------------------------------------------------#
+#                                          FakeFirebase                                           #
+#-------------------------------------------------------------------------------------------------#
+class FakeFirebase(ThreadingHTTPServer):
+    """
+    Local stand-in for the Firebase endpoints the application uses, for offline
+    testing and throughput benchmarks.
+
+    Serves the Realtime Database REST API (GET, PUT, PATCH with multi-location updates,
+    POST push and DELETE on <path>.json) from an in-memory tree, and the email/password
+    sign-in and token refresh of Firebase Authentication. Database requests need a valid
+    ID token in the auth parameter, and the tokens expire after token_lifetime seconds.
+
+    Every request can be delayed by latency (+ up to jitter) seconds, fail with 503 with
+    the probability error_rate and is answered with 429 when more than throttle requests
+    per second arrive. GET /__stats returns the request counters.
+    """
+    daemon_threads = True
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, host: str = "127.0.0.1", port: int = 9000, latency: float = 0, jitter: float = 0,
+                 error_rate: float = 0, throttle: float = 0, token_lifetime: int = 3600,
+                 users: dict | None = None, verbose: bool = False, seed: int | None = None) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle = throttle
+        self.token_lifetime = token_lifetime
+        self.users = users or {}    # Email -> password. Empty accepts any login.
+        self.verbose = verbose
+
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tree = {}
+        self.id_tokens = {}         # ID token -> (user ID, expiry time)
+        self.refresh_tokens = {}    # Refresh token -> user ID
+        self.counters = {}
+        self.thread = None
+
+        self._last_push_time = 0
+        self._last_push_random = [0] * 12
+        self._allowance = throttle
+        self._last_request = time.monotonic()
+
+        super().__init__((host, port), _Handler)
+
+    #---------------------------------------------------------------------------------------------#
+    # url - Base URL of the server, for databaseURL and authURL                                   #
+    #---------------------------------------------------------------------------------------------#
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    #---------------------------------------------------------------------------------------------#
+    # start - Serves requests in a background thread                                              #
+    #---------------------------------------------------------------------------------------------#
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.serve_forever, name="fake-firebase", daemon=True)
+        self.thread.start()
+
+    #---------------------------------------------------------------------------------------------#
+    # stop - Stops the background thread and closes the socket                                    #
+    #---------------------------------------------------------------------------------------------#
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    #---------------------------------------------------------------------------------------------#
+    # stats - Returns a copy of the request counters                                              #
+    #---------------------------------------------------------------------------------------------#
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counters)
+
+    #---------------------------------------------------------------------------------------------#
+    # count - Adds to a request counter                                                           #
+    #---------------------------------------------------------------------------------------------#
+    def count(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    #---------------------------------------------------------------------------------------------#
+    # inject_fault - Delays the request and returns the status of an injected failure, or None    #
+    #---------------------------------------------------------------------------------------------#
+    def inject_fault(self) -> int | None:
+        with self.lock:
+            # Token bucket of `throttle` requests per second
+            if self.throttle > 0:
+                now = time.monotonic()
+                self._allowance = min(self.throttle, self._allowance + (now - self._last_request) * self.throttle)
+                self._last_request = now
+
+                if self._allowance < 1:
+                    return 429
+                self._allowance -= 1
+
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            failed = self.error_rate > 0 and self.random.random() < self.error_rate
+
+        if delay > 0:
+            time.sleep(delay)
+
+        return 503 if failed else None
+
+    #---------------------------------------------------------------------------------------------#
+    # sign_in - Logs in a user. Returns the response, or None if the password is wrong.           #
+    #---------------------------------------------------------------------------------------------#
+    def sign_in(self, email: str, password: str) -> dict | None:
+        if self.users and self.users.get(email) != password:
+            return None
+
+        # The same email always gets the same user ID
+        user_id = hashlib.sha1(email.encode("utf-8")).hexdigest()[:28]
+        refresh_token = secrets.token_urlsafe(24)
+        with self.lock:
+            self.refresh_tokens[refresh_token] = user_id
+
+        return {
+            "kind": "identitytoolkit#VerifyPasswordResponse",
+            "localId": user_id,
+            "email": email,
+            "displayName": "",
+            "registered": True,
+            "idToken": self.issue_id_token(user_id),
+            "refreshToken": refresh_token,
+            "expiresIn": str(self.token_lifetime),
+        }
+
+    #---------------------------------------------------------------------------------------------#
+    # refresh - Exchanges a refresh token for a new ID token. Returns None if it is unknown.      #
+    #---------------------------------------------------------------------------------------------#
+    def refresh(self, refresh_token: str) -> dict | None:
+        with self.lock:
+            user_id = self.refresh_tokens.get(refresh_token)
+        if user_id is None:
+            return None
+
+        return {
+            "user_id": user_id,
+            "id_token": self.issue_id_token(user_id),
+            "refresh_token": refresh_token,
+            "expires_in": str(self.token_lifetime),
+            "token_type": "Bearer",
+        }
+
+    #---------------------------------------------------------------------------------------------#
+    # issue_id_token - Makes a new ID token for a user                                            #
+    #---------------------------------------------------------------------------------------------#
+    def issue_id_token(self, user_id: str) -> str:
+        id_token = secrets.token_urlsafe(32)
+        with self.lock:
+            self.id_tokens[id_token] = (user_id, time.time() + self.token_lifetime)
+        return id_token
+
+    #---------------------------------------------------------------------------------------------#
+    # check_token - Returns None if the ID token is valid, otherwise the error message            #
+    #---------------------------------------------------------------------------------------------#
+    def check_token(self, id_token: str | None) -> str | None:
+        with self.lock:
+            entry = self.id_tokens.get(id_token)
+
+        if entry is None:
+            return "Permission denied"
+        if entry[1] < time.time():
+            return "Auth token is expired"
+        return None
+
+    #---------------------------------------------------------------------------------------------#
+    # get - Returns the value at a path, or None                                                  #
+    #---------------------------------------------------------------------------------------------#
+    def get(self, keys: list):
+        with self.lock:
+            node = self.tree
+            for key in keys:
+                if not isinstance(node, dict) or key not in node:
+                    return None
+                node = node[key]
+            return node
+
+    #---------------------------------------------------------------------------------------------#
+    # set - Replaces the value at a path. None deletes it.                                        #
+    #---------------------------------------------------------------------------------------------#
+    def set(self, keys: list, value) -> None:
+        with self.lock:
+            self._set(keys, value)
+
+    #---------------------------------------------------------------------------------------------#
+    # update - Multi-location update. Every key of the values is a path under the base path.      #
+    #---------------------------------------------------------------------------------------------#
+    def update(self, keys: list, values: dict) -> None:
+        with self.lock:
+            for path, value in values.items():
+                self._set(keys + _split_path(path), value)
+
+    #---------------------------------------------------------------------------------------------#
+    # push - Adds a value under a new push key and returns the key                                #
+    #---------------------------------------------------------------------------------------------#
+    def push(self, keys: list, value) -> str:
+        with self.lock:
+            key = self._push_key()
+            self._set(keys + [key], value)
+        return key
+
+    #---------------------------------------------------------------------------------------------#
+    # _set - Replaces the value at a path. Must be called with the lock held.                     #
+    #---------------------------------------------------------------------------------------------#
+    def _set(self, keys: list, value) -> None:
+        if not keys:
+            self.tree = value if isinstance(value, dict) else {}
+            return
+
+        # Walk down the path, making the missing nodes
+        node = self.tree
+        for key in keys[:-1]:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = {}
+                node[key] = child
+            node = child
+
+        if value is None:
+            node.pop(keys[-1], None)
+        else:
+            node[keys[-1]] = value
+
+    #---------------------------------------------------------------------------------------------#
+    # _push_key - Chronologically ordered push key. Must be called with the lock held.            #
+    #---------------------------------------------------------------------------------------------#
+    def _push_key(self) -> str:
+        now = int(time.time() * 1000)
+
+        # Keys made in the same millisecond continue from the previous random part
+        if now == self._last_push_time:
+            for i in range(11, -1, -1):
+                if self._last_push_random[i] < 63:
+                    self._last_push_random[i] += 1
+                    break
+                self._last_push_random[i] = 0
+        else:
+            self._last_push_time = now
+            self._last_push_random = [self.random.randrange(64) for _ in range(12)]
+
+        time_chars = []
+        for _ in range(8):
+            time_chars.append(PUSH_CHARS[now % 64])
+            now //= 64
+
+        return "".join(reversed(time_chars)) + "".join(PUSH_CHARS[i] for i in self._last_push_random)
+
+#-------------------------------------------------------------------------------------------------#
+#                                            _Handler                                             #
+#-------------------------------------------------------------------------------------------------#
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Handles one connection of the fake server. HTTP/1.1 keeps the connection open, so
+    the application's keep-alive session works like it does with Firebase.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_PUT(self) -> None:
+        self._handle("PUT")
+
+    def do_PATCH(self) -> None:
+        self._handle("PATCH")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def do_DELETE(self) -> None:
+        self._handle("DELETE")
+
+    def log_message(self, format, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    #---------------------------------------------------------------------------------------------#
+    # _handle - Routes a request                                                                  #
+    #---------------------------------------------------------------------------------------------#
+    def _handle(self, method: str) -> None:
+        server = self.server
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        if url.path == STATS_PATH:
+            self._reply(200, server.stats())
+            return
+
+        server.count("requests")
+        server.count("bytes_received", length)
+
+        # Is a failure injected?
+        status = server.inject_fault()
+        if status is not None:
+            # Yes...
+            server.count("throttled" if status == 429 else "failed")
+            self._reply(status, {"error": "Too Many Requests" if status == 429 else "Service Unavailable"})
+            return
+
+        try:
+            data = json.loads(body) if body else None
+        except json.JSONDecodeError:
+            self._reply(400, {"error": "Invalid data; couldn't parse JSON object."})
+            return
+
+        # Authentication
+        if method == "POST" and url.path == SIGN_IN_PATH:
+            self._sign_in(data or {})
+            return
+        if method == "POST" and url.path == REFRESH_PATH:
+            self._refresh(data or {})
+            return
+
+        # Realtime Database
+        if not url.path.endswith(".json"):
+            self._reply(404, {"error": "Not Found"})
+            return
+
+        error = server.check_token(query.get("auth"))
+        if error is not None:
+            server.count("unauthorized")
+            self._reply(401, {"error": error})
+            return
+
+        keys = _split_path(url.path[:-len(".json")])
+        server.count(method.lower())
+
+        if method == "GET":
+            result = server.get(keys)
+        elif method == "PUT":
+            server.set(keys, data)
+            result = data
+        elif method == "PATCH":
+            if not isinstance(data, dict):
+                self._reply(400, {"error": "Invalid data; couldn't parse JSON object."})
+                return
+            server.update(keys, data)
+            server.count("updated_paths", len(data))
+            result = data
+        elif method == "POST":
+            result = {"name": server.push(keys, data)}
+        else:
+            server.set(keys, None)
+            result = None
+
+        # print=silent answers without a body, like Firebase
+        if query.get("print") == "silent":
+            self._reply(204, None)
+        else:
+            self._reply(200, result)
+
+    #---------------------------------------------------------------------------------------------#
+    # _sign_in - Email/password sign-in                                                           #
+    #---------------------------------------------------------------------------------------------#
+    def _sign_in(self, data: dict) -> None:
+        self.server.count("sign_in")
+        result = self.server.sign_in(data.get("email", ""), data.get("password", ""))
+
+        if result is None:
+            self._reply(400, {"error": {"code": 400, "message": "INVALID_PASSWORD"}})
+        else:
+            self._reply(200, result)
+
+    #---------------------------------------------------------------------------------------------#
+    # _refresh - Token refresh                                                                    #
+    #---------------------------------------------------------------------------------------------#
+    def _refresh(self, data: dict) -> None:
+        self.server.count("refresh")
+        result = self.server.refresh(data.get("refreshToken", ""))
+
+        if result is None:
+            self._reply(400, {"error": {"code": 400, "message": "INVALID_REFRESH_TOKEN"}})
+        else:
+            self._reply(200, result)
+
+    #---------------------------------------------------------------------------------------------#
+    # _reply - Sends a JSON response                                                              #
+    #---------------------------------------------------------------------------------------------#
+    def _reply(self, status: int, result) -> None:
+        body = b"" if status == 204 else json.dumps(result).encode("utf-8")
+
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        if body:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+#-------------------------------------------------------------------------------------------------#
+# _split_path - Splits a database path into its keys                                              #
+#-------------------------------------------------------------------------------------------------#
+def _split_path(path: str) -> list:
+    return [key for key in path.split("/") if key]
+
+#-------------------------------------------------------------------------------------------------#
+# _parse_user - Parses an EMAIL:PASSWORD command line argument                                    #
+#-------------------------------------------------------------------------------------------------#
+def _parse_user(text: str) -> tuple:
+    email, separator, password = text.partition(":")
+    if not separator:
+        raise argparse.ArgumentTypeError("expected EMAIL:PASSWORD")
+    return email, password
+
+#------------------------------------------------------------------------------------------------#
+#                                              MAIN                                              #
+#------------------------------------------------------------------------------------------------#
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Firebase endpoints of IsoLinna")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=9000, help="port to listen on (default 9000)")
+    parser.add_argument("--latency", type=float, default=0, metavar="SECONDS", help="delay of every request")
+    parser.add_argument("--jitter", type=float, default=0, metavar="SECONDS", help="random extra delay, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0, metavar="P", help="probability of a 503 response (0-1)")
+    parser.add_argument("--throttle", type=float, default=0, metavar="RPS", help="answer 429 above this many requests per second")
+    parser.add_argument("--token-lifetime", type=int, default=3600, metavar="SECONDS", help="lifetime of the ID tokens")
+    parser.add_argument(
+        "--user",
+        type=_parse_user,
+        action="append",
+        default=[],
+        metavar="EMAIL:PASSWORD",
+        help="accepted login, may be repeated. Without --user any login is accepted."
+    )
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    server = FakeFirebase(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle=args.throttle,
+        token_lifetime=args.token_lifetime,
+        users=dict(args.user),
+        verbose=args.verbose,
+    )
+
+    print(f"Fake Firebase listening on {server.url}. Use this isolinna.json:")
+    print(json.dumps({
+        "apiKey": "fake",
+        "authDomain": "localhost",
+        "databaseURL": server.url,
+        "authURL": server.url,
+        "storageBucket": "fake",
+    }, indent=2))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
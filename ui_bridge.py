@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+
+from constants import *
+
+#-------------------------------------------------------------------------------------------------#
+#                                            UiBridge                                             #
+#-------------------------------------------------------------------------------------------------#
+class UiBridge:
+    """
+    Carries UI updates from background threads to the urwid main loop.
+
+    Background threads call post() with a key and a callable instead of touching the
+    widgets. The callables run in the main loop at most max_rate times per second,
+    and only the newest callable of each key runs, so a burst of updates costs one
+    redraw.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, loop, max_rate: float = UI_REFRESH_RATE) -> None:
+        self.loop = loop
+        self.interval = 1 / max_rate
+
+        self._lock = threading.Lock()
+        self._pending = {}          # key -> callable
+        self._signaled = False      # True when the main loop has been woken up
+        self._alarm = None
+        self._last_flush = 0.0
+        self._fd = loop.watch_pipe(self._on_pipe)
+
+    #---------------------------------------------------------------------------------------------#
+    # post - Schedules a UI update. Safe to call from any thread.                                 #
+    #---------------------------------------------------------------------------------------------#
+    def post(self, key, callback) -> None:
+        with self._lock:
+            self._pending[key] = callback
+
+            # Is the main loop already woken up?
+            if self._signaled:
+                # Yes...
+                # The pending update will be run with the others
+                return
+            self._signaled = True
+
+        os.write(self._fd, b"\n")
+
+    #---------------------------------------------------------------------------------------------#
+    # close - Stops watching the pipe                                                             #
+    #---------------------------------------------------------------------------------------------#
+    def close(self) -> None:
+        if self._alarm is not None:
+            self.loop.remove_alarm(self._alarm)
+            self._alarm = None
+        self.loop.remove_watch_pipe(self._fd)
+
+    #---------------------------------------------------------------------------------------------#
+    # _on_pipe - Runs in the main loop when a background thread has posted an update              #
+    #---------------------------------------------------------------------------------------------#
+    def _on_pipe(self, data) -> bool:
+        # Has an update been run too recently?
+        delay = self._last_flush + self.interval - time.monotonic()
+        if delay > 0:
+            # Yes...
+            # Run the pending updates when the interval has passed
+            if self._alarm is None:
+                self._alarm = self.loop.set_alarm_in(delay, self._on_alarm)
+        else:
+            # No...
+            self._flush()
+
+        return True     # Keep the pipe open
+
+    #---------------------------------------------------------------------------------------------#
+    # _on_alarm - Rate limit alarm                                                                #
+    #---------------------------------------------------------------------------------------------#
+    def _on_alarm(self, loop, user_data=None) -> None:
+        self._alarm = None
+        self._flush()
+
+    #---------------------------------------------------------------------------------------------#
+    # _flush - Runs the pending updates. The main loop redraws the screen afterwards.             #
+    #---------------------------------------------------------------------------------------------#
+    def _flush(self) -> None:
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._signaled = False
+
+        self._last_flush = time.monotonic()
+
+        for callback in pending.values():
+            callback()
@@ -0,0 +1,190 @@
+import time
+import urwid
+
+import globals
+from constants import *
+
+# Column titles and widths
+COLUMNS = (
+    ("MAC address", 17),
+    ("Temp", 8),
+    ("Humid", 6),
+    ("Pressure", 8),
+    ("RSSI", 4),
+    ("Battery", 7),
+    ("Seen", 5),
+    ("Upload", 6),
+)
+
+#-------------------------------------------------------------------------------------------------#
+#                                            SensorRow                                            #
+#-------------------------------------------------------------------------------------------------#
+class SensorRow(urwid.WidgetWrap):
+    """
+    One row of the dashboard. The row keeps the text of every cell and only changes the
+    cells whose text has changed, so the unchanged rows are drawn from urwid's canvas cache.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, mac_address: str) -> None:
+        self.cells = [urwid.Text("", wrap=urwid.CLIP) for _ in COLUMNS]
+        self.texts = [None] * len(COLUMNS)
+        self.followed = None
+
+        self.cells[0].set_text(mac_address)
+        self.texts[0] = mac_address
+
+        self.mac_attr = urwid.AttrMap(self.cells[0], "body")
+        cells = [self.mac_attr] + self.cells[1:]
+
+        super().__init__(urwid.Columns(
+            [(width, cell) for (title, width), cell in zip(COLUMNS, cells)],
+            dividechars=1
+        ))
+
+    #---------------------------------------------------------------------------------------------#
+    # update - Shows the record. Returns True if anything changed.                                #
+    #---------------------------------------------------------------------------------------------#
+    def update(self, record, now: float) -> bool:
+        changed = False
+
+        # Followed sensors are highlighted
+        if record.followed != self.followed:
+            self.followed = record.followed
+            self.mac_attr.set_attr_map({None: "info" if record.followed else "body"})
+            changed = True
+
+        for i, text in enumerate(_cell_texts(record, now), start=1):
+            if text != self.texts[i]:
+                self.texts[i] = text
+                self.cells[i].set_text(text)
+                changed = True
+
+        return changed
+
+#-------------------------------------------------------------------------------------------------#
+#                                         SensorDashboard                                         #
+#-------------------------------------------------------------------------------------------------#
+class SensorDashboard(urwid.WidgetWrap):
+    """
+    Live table of every sensor in the sensor registry.
+
+    An alarm refreshes the table every refresh_interval seconds. A row widget is made
+    once per sensor and reused, and only the cells whose text has changed are updated,
+    so a refresh where nothing changed draws nothing.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, refresh_interval: float = DASHBOARD_REFRESH_INTERVAL) -> None:
+        self.refresh_interval = refresh_interval
+        self.sensor_rows = {}      # MAC -> SensorRow
+        self.alarm = None
+        self.loop = None
+        self.watch = None
+
+        header = urwid.Columns(
+            [(width, urwid.Text(("info", title), wrap=urwid.CLIP)) for title, width in COLUMNS],
+            dividechars=1
+        )
+
+        self.walker = urwid.SimpleListWalker([])
+        listbox = urwid.ListBox(self.walker)
+
+        box = urwid.LineBox(
+            urwid.Padding(urwid.Frame(listbox, header=header), left=1, right=1),
+            tlcorner=urwid.LineBox.Symbols.LIGHT.TOP_LEFT_ROUNDED,
+            trcorner=urwid.LineBox.Symbols.LIGHT.TOP_RIGHT_ROUNDED,
+            blcorner=urwid.LineBox.Symbols.LIGHT.BOTTOM_LEFT_ROUNDED,
+            brcorner=urwid.LineBox.Symbols.LIGHT.BOTTOM_RIGHT_ROUNDED,
+            title="Sensors",
+            title_align="center"
+        )
+
+        super().__init__(urwid.AttrMap(box, "body"))
+
+    #---------------------------------------------------------------------------------------------#
+    # start - Starts refreshing the table                                                         #
+    #---------------------------------------------------------------------------------------------#
+    def start(self, loop: urwid.MainLoop) -> None:
+        self.loop = loop
+
+        # The dashboard only reads the registry, so it watches it instead of subscribing
+        self.watch = globals.ble_source.watch()
+
+        self.refresh()
+
+    #---------------------------------------------------------------------------------------------#
+    # stop - Stops refreshing the table                                                           #
+    #---------------------------------------------------------------------------------------------#
+    def stop(self) -> None:
+        if self.watch is not None:
+            self.watch.close()
+            self.watch = None
+
+        if self.alarm is not None:
+            self.loop.remove_alarm(self.alarm)
+            self.alarm = None
+
+    #---------------------------------------------------------------------------------------------#
+    # refresh - Updates the changed rows and adds rows for new sensors                            #
+    #---------------------------------------------------------------------------------------------#
+    def refresh(self, loop=None, user_data=None) -> None:
+        now = time.time()
+
+        for record in globals.sensors:
+            row = self.sensor_rows.get(record.mac_address)
+
+            # Is this a new sensor?
+            if row is None:
+                # Yes...
+                row = SensorRow(record.mac_address)
+                self.sensor_rows[record.mac_address] = row
+                self.walker.append(row)
+
+            row.update(record, now)
+
+        self.alarm = self.loop.set_alarm_in(self.refresh_interval, self.refresh)
+
+#-------------------------------------------------------------------------------------------------#
+# _cell_texts - Texts of the value cells of a record                                              #
+#-------------------------------------------------------------------------------------------------#
+def _cell_texts(record, now: float) -> tuple:
+    data = record.data or {}
+
+    return (
+        _format(data.get('temperature'), "{:.2f}°C"),
+        _format(data.get('humidity'), "{:.1f}%"),
+        _format(data.get('pressure'), "{:.1f}"),
+        _format(record.rssi, "{}"),
+        _format(data.get('battery'), "{}mV"),
+        _age(record.last_seen, now),
+        _age(record.last_sent, now),
+    )
+
+def _format(value, template: str) -> str:
+    if value is None:
+        return "-"
+    return template.format(value)
+
+#-------------------------------------------------------------------------------------------------#
+# _age - Time since a timestamp. The text changes at most every few seconds, so the column        #
+#        doesn't redraw every row on every refresh.                                               #
+#-------------------------------------------------------------------------------------------------#
+def _age(timestamp, now: float) -> str:
+    if timestamp is None:
+        return "-"
+
+    age = max(0, int(now - timestamp))
+    if age < 5:
+        return "now"
+    if age < 60:
+        return f"{age // 5 * 5}s"
+    if age < 3600:
+        return f"{age // 60}m"
+    if age < 86400:
+        return f"{age // 3600}h"
+    return f"{age // 86400}d"
@@ -0,0 +1,150 @@
+import urwid
+
+from buttons.sensor_button import SensorButton
+
+# Sort orders
+SORT_NONE = None                # Order in which the sensors became known
+SORT_RSSI = "rssi"              # Strongest signal first
+SORT_LAST_SEEN = "last_seen"    # Most recently seen first
+
+#-------------------------------------------------------------------------------------------------#
+#                                        SensorListWalker                                         #
+#-------------------------------------------------------------------------------------------------#
+class SensorListWalker(urwid.ListWalker):
+    """
+    Lazy list of the sensors in the sensor registry for a urwid.ListBox.
+
+    The walker keeps only the MAC addresses of the visible sensors. A SensorButton is
+    made the first time the ListBox asks for its row, so only the rows on the screen
+    are built, and it is reused after that. The fixed widgets (e.g. the Automatic
+    button) come before the sensors. Filtering and sorting reorder the MAC addresses
+    and keep the buttons.
+    """
+
+    #---------------------------------------------------------------------------------------------#
+    # Constructor                                                                                 #
+    #---------------------------------------------------------------------------------------------#
+    def __init__(self, registry, selected: dict, callback, fixed=()) -> None:
+        self.registry = registry
+        self.selected = selected    # Selected MACs. Shared with the owner of the walker.
+        self.callback = callback
+        self.fixed = list(fixed)
+
+        self.filter_text = ""
+        self.sort = SORT_NONE
+
+        self._macs = []
+        self._positions = {}        # MAC -> index in _macs
+        self._buttons = {}          # MAC -> SensorButton, built on demand
+        self.focus = 0
+
+        self.refresh()
+
+    #---------------------------------------------------------------------------------------------#
+    # ListWalker interface                                                                        #
+    #---------------------------------------------------------------------------------------------#
+    def __len__(self) -> int:
+        return len(self.fixed) + len(self._macs)
+
+    def __getitem__(self, position: int) -> urwid.Widget:
+        if position < 0:
+            raise IndexError(position)
+        if position < len(self.fixed):
+            return self.fixed[position]
+
+        mac_address = self._macs[position - len(self.fixed)]
+        button = self._buttons.get(mac_address)
+
+        # Has the row been shown before?
+        if button is None:
+            # No...
+            button = SensorButton(mac_address, callback=self.callback, selected=mac_address in self.selected)
+            self._buttons[mac_address] = button
+
+        return button
+
+    def next_position(self, position: int) -> int:
+        if position + 1 >= len(self):
+            raise IndexError(position)
+        return position + 1
+
+    def prev_position(self, position: int) -> int:
+        if position <= 0:
+            raise IndexError(position)
+        return position - 1
+
+    def set_focus(self, position: int) -> None:
+        self.focus = position
+        self._modified()
+
+    #---------------------------------------------------------------------------------------------#
+    # add - Adds a new sensor to the end of the list, if it passes the filter                     #
+    #---------------------------------------------------------------------------------------------#
+    def add(self, mac_address: str) -> None:
+        if mac_address in self._positions or not self._matches(mac_address):
+            return
+
+        # Is the list sorted?
+        if self.sort is not SORT_NONE:
+            # Yes...
+            # The new sensor can belong anywhere
+            self.refresh()
+            return
+
+        self._positions[mac_address] = len(self._macs)
+        self._macs.append(mac_address)
+        self._modified()
+
+    #---------------------------------------------------------------------------------------------#
+    # set_filter - Shows only the sensors whose MAC address contains the text                     #
+    #---------------------------------------------------------------------------------------------#
+    def set_filter(self, text: str) -> None:
+        self.filter_text = text.strip().upper()
+        self.refresh()
+
+    #---------------------------------------------------------------------------------------------#
+    # set_sort - Changes the sort order                                                           #
+    #---------------------------------------------------------------------------------------------#
+    def set_sort(self, sort) -> None:
+        self.sort = sort
+        self.refresh()
+
+    #---------------------------------------------------------------------------------------------#
+    # update_selection - Shows the current selection on the buttons that have been built         #
+    #---------------------------------------------------------------------------------------------#
+    def update_selection(self) -> None:
+        for mac_address, button in self._buttons.items():
+            button.set_selected(mac_address in self.selected)
+
+    #---------------------------------------------------------------------------------------------#
+    # refresh - Rebuilds the list of visible MAC addresses. Keeps the focused sensor in focus.    #
+    #---------------------------------------------------------------------------------------------#
+    def refresh(self) -> None:
+        # Which sensor has the focus?
+        focused = None
+        if len(self.fixed) <= self.focus < len(self):
+            focused = self._macs[self.focus - len(self.fixed)]
+
+        records = [record for record in self.registry if self._matches(record.mac_address)]
+
+        if self.sort == SORT_RSSI:
+            records.sort(key=lambda record: record.rssi if record.rssi is not None else -1000, reverse=True)
+        elif self.sort == SORT_LAST_SEEN:
+            records.sort(key=lambda record: record.last_seen or 0, reverse=True)
+
+        self._macs = [record.mac_address for record in records]
+        self._positions = {mac_address: i for i, mac_address in enumerate(self._macs)}
+
+        # Keep the focus on the same sensor if it is still visible
+        if focused in self._positions:
+            self.focus = len(self.fixed) + self._positions[focused]
+        elif self.focus >= len(self):
+            self.focus = max(0, len(self) - 1)
+
+        self._modified()
+
+    #---------------------------------------------------------------------------------------------#
+    # _matches - Tells if a sensor passes the filter                                              #
+    #---------------------------------------------------------------------------------------------#
+    def _matches(self, mac_address: str) -> bool:
+        return not self.filter_text or self.filter_text in mac_address.upper()